@@ -1,14 +1,176 @@
 import streamlit as st
 import requests
-import random
 import os
 import json
-from utils.io import load_examples
-from utils.processing import get_transition_from_gpt
-from utils.layout import rebuild_article_with_transitions
-from utils.display import layout_title_and_input, show_output, show_version
-from utils.version import compute_version_hash
-from utils.title_blurb import generate_title_and_blurb
+import sys
+from utils.io import load_example_store
+from utils.layout import rebuild_article_with_transitions, segment
+from utils.display import layout_title_and_input, show_output, show_version, show_live_preview, show_debug_events, show_metrics_summary, show_repairs
+from utils.events import EventLog, fanout, notify, span
+from utils.metrics import Metrics
+from utils.resilience import RetryPolicy, DEFAULT_MAX_ATTEMPTS
+from utils.version import compute_version_hash, VERSION_FILES
+from utils.engine import generate_article, ArticleMemo, DEFAULT_MAX_WORKERS, DEFAULT_ARTICLE_DEADLINE, GENERATION_MODES, SAMPLERS
+from utils.client import DEFAULT_POOL_CONNECTIONS, DEFAULT_TIMEOUT, DEFAULT_MAX_OUTSTANDING
+from utils.resources import get_http_session, get_response_cache, get_metrics, get_single_flight, get_request_semaphore, get_job_runner
+from utils.jobs import DEFAULT_JOB_WORKERS, DEFAULT_POLL_SECONDS
+from utils.cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS
+from utils.prompts import DEFAULT_TOKEN_BUDGET
+from utils.router import Router, parse_endpoints, DEFAULT_HEDGE_QUANTILE
+from utils.backends import make_client, BACKENDS
+from utils.validation import get_candidate_pool, repair_transitions
+from utils.title_blurb import failure_message
+
+def run_generation(job, document, client, memo, accepted, metrics, metrics_path, **options):
+    """
+    Background job (see utils.jobs): generate, validate and rebuild one
+    article. Runs on a worker thread, so it never calls Streamlit: the live
+    preview goes through job.update and everything to show is returned.
+    'document' is the segmented input (utils.layout.segment), 'memo' the
+    ArticleMemo to reuse from (None to regenerate everything), 'accepted'
+    the one to record the result in.
+    """
+    run_metrics = Metrics()
+    debug_log = EventLog()
+    observer = fanout(debug_log, run_metrics, metrics)
+    result = {
+        "text": document.text, "client": client, "metrics": run_metrics, "events": [],
+        "title_blurb": "", "title_error": None, "transitions": [], "repairs": [], "rebuilt_text": "", "error": None, "failure": None,
+    }
+
+    try:
+        # ✅ Load few-shot examples (cached per process, bucketed by word count)
+        with span(observer, "load_examples"):
+            examples = load_example_store()
+
+        # ✅ Paragraphs around each marker
+        parts = document.parts
+
+        # ✅ Live preview, updated as soon as each response arrives
+        job.update("document", document)
+        job.update("title", "")
+        job.update("transitions", [None] * len(document))
+
+        def on_update(kind, index, text, done):
+            shown = text if done else f"{text} …"
+            if kind == "title":
+                job.update("title", shown)
+            else:
+                job.update("transitions", shown, index=index)
+
+        # ✅ Generate title/blurb and all transitions concurrently
+        title_blurb, generated_transitions = generate_article(
+            parts, examples, client, on_update=on_update, observer=observer, memo=memo, **options
+        )
+        result["events"] = debug_log.snapshot()
+        if title_blurb is None:
+            result["title_error"] = failure_message(result["events"])
+
+        # ✅ VALIDATION: exactly 5 words and no repeats, fixed locally in one pass
+        with span(observer, "repair"):
+            generated_transitions, repairs = repair_transitions(
+                generated_transitions, get_candidate_pool(examples)
+            )
+        for r in repairs:
+            notify(observer, "repair", source="app", action=r.action)
+        accepted.remember(parts, title_blurb, generated_transitions, repairs)
+
+        # ✅ Rebuild the final article with transitions inserted
+        with span(observer, "rebuild"):
+            rebuilt_text, error = rebuild_article_with_transitions(document, generated_transitions)
+        result.update(
+            title_blurb=title_blurb, transitions=generated_transitions, repairs=repairs,
+            rebuilt_text=rebuilt_text, error=error,
+        )
+    except Exception as e:
+        result["failure"] = str(e)
+
+    # ✅ Export the cumulative metrics (Prometheus text, or JSON for *.json)
+    if metrics_path:
+        try:
+            metrics.write(metrics_path)
+        except OSError as e:
+            print(f"Could not write metrics to {metrics_path}: {e}", file=sys.stderr)
+    return result
+
+
+@st.fragment(run_every=DEFAULT_POLL_SECONDS)
+def show_job_progress(job):
+    """
+    Live preview of a running job, refreshed on its own until the job is
+    done; then one full rerun shows the result.
+    """
+    if job.done:
+        st.rerun()
+    progress = job.progress()
+    st.info(f"⏳ Génération en cours... ({job.elapsed():.0f} s)")
+    if "transitions" in progress:
+        preview, _ = rebuild_article_with_transitions(
+            progress["document"], [t or "⏳" for t in progress["transitions"]]
+        )
+        show_live_preview(st.empty(), progress["title"], preview, progress["transitions"])
+
+
+def show_generation(job):
+    """
+    Result of a finished job (kept in the session, so shown on every rerun).
+    """
+    result = job.result
+    if result is None or result["failure"]:
+        st.error(f"Une erreur s'est produite: {result['failure'] if result else job.error}")
+        st.info("Vérifiez les paramètres de l'API et réessayez.")
+        return
+
+    show_debug_events(result["events"])
+    show_repairs(result["repairs"])
+
+    reused = result["metrics"].counter("reused_total", kind="transition")
+    if reused:
+        st.info(f"♻️ {reused} transition(s) reprise(s) de la génération précédente (paragraphes inchangés).")
+
+    if result["error"]:
+        st.error(result["error"])
+        return
+
+    title_blurb = result["title_blurb"]
+    # ✅ Nicely render Titre and Chapeau with required spacing
+    if title_blurb is None:
+        # Not kept for reuse: the next "Générer" asks for it again
+        reason = (result["title_error"] or "").replace("Titre :", "").replace("\nChapeau :", " —").strip().rstrip(".")
+        st.warning(
+            f"⚠️ Le titre et le chapeau n'ont pas pu être générés ({reason or 'API indisponible'}). "
+            "Cliquez de nouveau sur « Générer » pour réessayer."
+        )
+    elif "Titre :" in title_blurb and "Chapeau :" in title_blurb:
+        lines = title_blurb.split("\n")
+        title_line = next((l for l in lines if l.startswith("Titre :")), "")
+        chapo_line = next((l for l in lines if l.startswith("Chapeau :")), "")
+
+        st.markdown("### 📰 Titre")
+        st.markdown(f"**{title_line.replace('Titre :', '').strip()}**")
+
+        # 3 blank lines between title and chapeau
+        st.markdown("&nbsp;\n&nbsp;\n&nbsp;", unsafe_allow_html=True)
+
+        st.markdown("### ✏️ Chapeau")
+        st.markdown(chapo_line.replace("Chapeau :", "").strip())
+
+        # 6 blank lines after the title/chapeau block
+        st.markdown("&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;", unsafe_allow_html=True)
+    else:
+        # Fallback if format is unexpected
+        st.markdown("### 📰 Titre et chapeau")
+        st.markdown(title_blurb)
+        st.markdown("&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;", unsafe_allow_html=True)
+
+    # ✅ Display full output article with transitions
+    st.markdown("### 🧾 Article reconstruit")
+    show_output(result["rebuilt_text"])
+
+    # ✅ Display generated transitions list
+    st.markdown("### 🧩 Transitions générées")
+    for i, t in enumerate(result["transitions"], 1):
+        st.markdown(f"{i}. _{t}_")
 
 def main():
     # Show app title and version info
@@ -20,182 +182,179 @@ def main():
         api_url = st.secrets["API_URL"]
         api_token = st.secrets["API_TOKEN"]
     else:
-        api_url = st.secrets["API_URL"]
-        api_token = st.secrets["API_TOKEN"]
-    
-    # Create headers with authentication
-    headers = {
-        "Content-Type": "application/json"
-    }
-    if api_token:
-        headers["Authorization"] = f"Bearer {api_token}"
+        api_url = os.environ.get("API_URL", "")
+        api_token = os.environ.get("API_TOKEN", "")
     
+    # ✅ Backend endpoints: API_ENDPOINTS (list of url/token/weight), or API_URL alone
+    endpoints = parse_endpoints(st.secrets.get("API_ENDPOINTS"), api_url, api_token)
+
+    # Backend: "http" (POST {"prompt"} to the URL) or "openai" (OpenAI SDK,
+    # the URL being an OpenAI-compatible base URL, with OPENAI_MODEL)
+    backend = st.secrets.get("BACKEND", "http")
+    if backend not in BACKENDS:
+        backend = "http"
+    model = st.secrets.get("OPENAI_MODEL") or None
+
     # Validate that API credentials are available
-    if not api_url:
+    if not endpoints:
         st.error("⚠️ API URL not found. Please set the API_URL in Streamlit secrets or environment variables.")
         st.info("Follow the README.md instructions for setting up API credentials.")
         return
+
+    # Maximum number of API calls in flight at once
+    max_workers = int(st.secrets.get("MAX_CONCURRENCY", DEFAULT_MAX_WORKERS))
+
+    # Few-shot example sampler: "random" or "similar" (TF-IDF nearest examples)
+    sampler = st.secrets.get("EXAMPLE_SAMPLER", "random")
+    if sampler not in SAMPLERS:
+        sampler = "random"
+
+    # Generation mode: "parallel" (one call per pair) or "batch" (one call per article)
+    mode = st.secrets.get("GENERATION_MODE", "parallel")
+    if mode not in GENERATION_MODES:
+        mode = "parallel"
+
+    # Total time budget per article (seconds), bounding tail latency in outages
+    deadline = float(st.secrets.get("ARTICLE_DEADLINE_SECONDS", DEFAULT_ARTICLE_DEADLINE))
+
+    # Estimated token budget of each per-pair prompt (long paragraphs are windowed)
+    token_budget = int(st.secrets.get("PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+    # Transitions requested per call, scored locally to avoid re-asking (1 = off)
+    candidates = max(1, int(st.secrets.get("TRANSITION_CANDIDATES", 1)))
+
+    # Ask the backend to stream tokens (SSE/chunked) into the live preview
+    stream = bool(st.secrets.get("STREAM_RESPONSES", False))
+
+    # Articles generated at the same time (background jobs), and the cap on
+    # backend requests in flight for the whole server process
+    job_workers = int(st.secrets.get("JOB_WORKERS", DEFAULT_JOB_WORKERS))
+    max_outstanding = int(st.secrets.get("MAX_OUTSTANDING_REQUESTS", DEFAULT_MAX_OUTSTANDING))
+
+    # ✅ Shared keep-alive HTTP client (connection pool reused across reruns),
+    # sized for every request that can be in flight at once so none of the
+    # keep-alive connections is discarded under load
+    session = get_http_session(
+        int(st.secrets.get("HTTP_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS)),
+        int(st.secrets.get("HTTP_POOL_MAXSIZE", min(max_outstanding, job_workers * max_workers))),
+    )
+    timeout = (
+        float(st.secrets.get("HTTP_CONNECT_TIMEOUT", DEFAULT_TIMEOUT[0])),
+        float(st.secrets.get("HTTP_READ_TIMEOUT", DEFAULT_TIMEOUT[1])),
+    )
+
+    # ✅ Persistent response cache keyed by prompt hash (shared by all sessions)
+    cache = get_response_cache(
+        st.secrets.get("RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+        int(st.secrets.get("RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        int(st.secrets.get("RESPONSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        float(st.secrets.get("RESPONSE_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+    )
     
+    # ✅ Identical in-flight requests coalesced across sessions, and a global
+    # cap on outstanding backend requests for the whole server process
+    single_flight = get_single_flight()
+    semaphore = get_request_semaphore(max_outstanding)
+
+    # ✅ Per-stage timings and counters, per run and cumulated for the process
+    metrics = get_metrics()
+    metrics_path = st.secrets.get("METRICS_PATH", "")
+
+    # ✅ Background workers generating articles for every session
+    job_runner = get_job_runner(job_workers)
+
+    # ✅ Accepted title and transitions of this session's last article, so an
+    # edit only regenerates the transitions around the edited paragraphs
+    memo = st.session_state.setdefault("article_memo", ArticleMemo())
+
     # ✅ Compute version hash for debug and traceability
-    VERSION = compute_version_hash([
-        "app.py",
-        "transitions.json",
-        "utils/io.py",
-        "utils/processing.py",
-        "utils/layout.py",
-        "utils/display.py",
-        "utils/version.py",
-        "utils/title_blurb.py"
-    ])
+    VERSION = compute_version_hash(VERSION_FILES)
 
     # ✅ Display input UI
     text_input = layout_title_and_input()
 
-    if st.button("✨ Générer les transitions"):
-        # Add a spinner during processing
-        with st.spinner("Génération en cours..."):
-            if "TRANSITION" not in text_input:
-                st.warning("Aucune balise `TRANSITION` trouvée.")
-                return
-
-            try:
-                # ✅ Load few-shot examples
-                examples = load_examples()
-
-                # ✅ Split input into paragraphs and transition pairs
-                parts = text_input.split("TRANSITION")
-                pairs = list(zip(parts[:-1], parts[1:]))
-
-                # ✅ Generate title and blurb from the first paragraph
-                title_blurb = generate_title_and_blurb(parts[0], api_url, headers)
-
-                # ✅ Generate transitions for each paragraph pair
-                generated_transitions = []
-                for para_a, para_b in pairs:
-                    transition = get_transition_from_gpt(para_a, para_b, examples, api_url, headers=headers, previous_transitions=generated_transitions)
-                    generated_transitions.append(transition)
-
-                # ✅ VALIDATION: Check for duplicate transitions
-                transition_count = {}
-                for t in generated_transitions:
-                    transition_count[t] = transition_count.get(t, 0) + 1
-
-                # Check for duplicates
-                duplicates = [t for t, count in transition_count.items() if count > 1]
-                if duplicates:
-                    st.warning(f"🚨 Transitions répétées détectées: {', '.join(duplicates)}")
-                    
-                    # Fix duplicates by adding a variation marker
-                    for i in range(1, len(generated_transitions)):
-                        if generated_transitions[i] in generated_transitions[:i]:
-                            # Add a variation to make it unique - all guaranteed to be 5 words
-                            variations = [
-                                "À noter également ce fait", 
-                                "Il faut aussi mentionner ceci", 
-                                "Soulignons encore ce point important", 
-                                "Précisons ce point très important", 
-                                "Ajoutons cette information très essentielle"
-                            ]
-                            generated_transitions[i] = variations[i % len(variations)]
-
-                # ✅ VALIDATION: Verify each transition has exactly 5 words
-                invalid_word_count = []
-                for i, t in enumerate(generated_transitions):
-                    words = t.split()
-                    word_count = len(words)
-                    
-                    if word_count != 5:
-                        # Store the original for reporting
-                        invalid_word_count.append(f"Transition {i+1} ({word_count} mots): '{t}'")
-                        
-                        # Automatic correction based on word count
-                        if word_count > 5:
-                            # If too long, trim to 5 words
-                            generated_transitions[i] = " ".join(words[:5])
-                            st.info(f"Transition {i+1} raccourcie à 5 mots: '{generated_transitions[i]}'")
-                        elif word_count < 5:
-                            # If too short, add generic words to reach 5
-                            if word_count == 4:
-                                # Add one word based on context
-                                if i == len(generated_transitions) - 1:  # Last transition
-                                    generated_transitions[i] = t + " maintenant"
-                                else:
-                                    generated_transitions[i] = t + " notamment"
-                            elif word_count == 3:
-                                # Add two words
-                                generated_transitions[i] = t + " comme on sait"
-                            else:
-                                # Fallback for very short transitions - ensured exactly 5 words
-                                fillers = ["Comme on peut le constater", 
-                                        "Il faut bien le dire",
-                                        "À ce stade, précisons que",
-                                        "Dans ce contexte particulier",
-                                        "Pour bien comprendre ceci"
-                                ]
-                                generated_transitions[i] = random.choice(fillers)
-                            
-                            st.info(f"Transition {i+1} complétée à 5 mots: '{generated_transitions[i]}'")
-
-                if invalid_word_count:
-                    st.warning(f"🚨 Transitions qui ne respectaient pas la règle de 5 mots: {', '.join(invalid_word_count)}")
-
-                # ✅ Final validation check after corrections
-                for i, t in enumerate(generated_transitions):
-                    word_count = len(t.split())
-                    if word_count != 5:
-                        st.error(f"⛔ ERREUR: La transition {i+1} a toujours {word_count} mots après correction")
-                        # Last resort fix - ensure exactly 5 words
-                        generated_transitions[i] = "Passons maintenant au point suivant"
-
-                # ✅ Rebuild the final article with transitions inserted
-                rebuilt_text, error = rebuild_article_with_transitions(text_input, generated_transitions)
-                if error:
-                    st.error(error)
-                else:
-                    # ✅ Nicely render Titre and Chapeau with required spacing
-                    if "Titre :" in title_blurb and "Chapeau :" in title_blurb:
-                        lines = title_blurb.split("\n")
-                        title_line = next((l for l in lines if l.startswith("Titre :")), "")
-                        chapo_line = next((l for l in lines if l.startswith("Chapeau :")), "")
-
-                        st.markdown("### 📰 Titre")
-                        st.markdown(f"**{title_line.replace('Titre :', '').strip()}**")
-
-                        # 3 blank lines between title and chapeau
-                        st.markdown("&nbsp;\n&nbsp;\n&nbsp;", unsafe_allow_html=True)
-
-                        st.markdown("### ✏️ Chapeau")
-                        st.markdown(chapo_line.replace("Chapeau :", "").strip())
-
-                        # 6 blank lines after the title/chapeau block
-                        st.markdown("&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;", unsafe_allow_html=True)
-                    else:
-                        # Fallback if format is unexpected
-                        st.markdown("### 📰 Titre et chapeau")
-                        st.markdown(title_blurb)
-                        st.markdown("&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;\n&nbsp;", unsafe_allow_html=True)
-
-                    # ✅ Display full output article with transitions
-                    st.markdown("### 🧾 Article reconstruit")
-                    show_output(rebuilt_text)
-
-                    # ✅ Display generated transitions list
-                    st.markdown("### 🧩 Transitions générées")
-                    for i, t in enumerate(generated_transitions, 1):
-                        st.markdown(f"{i}. _{t}_")
-            
-            except Exception as e:
-                st.error(f"Une erreur s'est produite: {str(e)}")
-                st.info("Vérifiez les paramètres de l'API et réessayez.")
+    generate = st.button("✨ Générer les transitions")
+    regenerate = st.button("🔄 Regénérer (sans cache)")
+
+    # ✅ Generation runs as a background job; it (and its result) is kept in
+    # the session so reruns re-attach to it instead of starting over
+    job = st.session_state.get("generation_job")
+
+    if generate or regenerate:
+        # ✅ Split input into paragraphs around each marker (once, reused
+        # for generation, previews and the final article)
+        document = segment(text_input)
+        if not len(document):
+            st.warning("Aucune balise `TRANSITION` trouvée.")
+            return
+
+        if job is not None and not job.done:
+            st.info("⏳ Une génération est déjà en cours, son résultat s'affichera ci-dessous.")
+        else:
+            # The regenerate button bypasses cached responses and reused
+            # transitions (and refreshes them)
+            retry_policy = RetryPolicy(max_attempts=int(st.secrets.get("RETRY_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)))
+            if len(endpoints) == 1:
+                client = make_client(
+                    backend, endpoints[0], model=model, session=session, timeout=timeout,
+                    cache=cache, read_cache=not regenerate, retry_policy=retry_policy,
+                    single_flight=single_flight, semaphore=semaphore,
+                )
+            else:
+                # ✅ Several endpoints: balanced by observed latency, failover on
+                # errors, and optional hedged requests past the p95 latency
+                client = Router(
+                    [
+                        make_client(
+                            backend, ep, model=model, session=session, timeout=timeout,
+                            retry_policy=retry_policy, semaphore=semaphore,
+                        )
+                        for ep in endpoints
+                    ],
+                    weights=[ep["weight"] for ep in endpoints],
+                    hedge=bool(st.secrets.get("HEDGE_REQUESTS", False)),
+                    hedge_quantile=float(st.secrets.get("HEDGE_QUANTILE", DEFAULT_HEDGE_QUANTILE)),
+                    cache=cache, read_cache=not regenerate, model=model, single_flight=single_flight,
+                )
+
+            job = job_runner.submit(
+                run_generation, document, client, None if regenerate else memo, memo, metrics, metrics_path,
+                max_workers=max_workers, sampler=sampler, mode=mode, stream=stream,
+                deadline=deadline, token_budget=token_budget, candidates=candidates,
+            )
+            st.session_state["generation_job"] = job
+
+    if job is not None:
+        if job.done:
+            show_generation(job)
+        else:
+            # ✅ Live preview, polled from the job without blocking the script
+            show_job_progress(job)
 
     # ✅ Always show version
     show_version(VERSION)
 
     # Add useful debugging info in an expandable section at the bottom
     with st.expander("🔧 Informations de débogage", expanded=False):
-        st.write("**API URL:**", api_url if api_url else "Non configurée")
+        st.write("**API URL:**", ", ".join(ep["url"] for ep in endpoints) if endpoints else "Non configurée")
+        st.write("**Backend:**", backend if backend == "http" else f"{backend} ({model or 'modèle par défaut'})")
         st.write("**API Token:**", "Configuré ✓" if api_token else "Non configuré ✗")
-        if not api_url or not api_token:
+        cache_stats = cache.stats()
+        st.write(
+            "**Cache des réponses:**",
+            f"{cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['entries']} entrées, {cache_stats['bytes'] // 1024} Ko)",
+        )
+        st.write("**Générations en cours (serveur):**", job_runner.active())
+        if job is not None and job.done and job.result is not None:
+            st.write("**Mesures de cette exécution:**")
+            show_metrics_summary(job.result["metrics"])
+            if isinstance(job.result["client"], Router):
+                st.write("**Points d'accès:**")
+                st.table(job.result["client"].stats())
+        st.write("**Mesures cumulées (format Prometheus):**")
+        st.code(metrics.to_prometheus(), language="text")
+        if not endpoints or not all(ep["token"] for ep in endpoints):
             st.warning("Les informations d'API ne sont pas correctement configurées.")
             st.info("Consultez le fichier README.md pour instructions.")
 
@@ -0,0 +1,132 @@
+# benchmarks/layout.py
+#
+# Benchmark of article segmentation and reconstruction on very large inputs.
+#
+#   python -m benchmarks.layout --sizes 1,2,4,8 --markers 500 -o layout.json
+#
+# Synthetic dossiers of the given sizes (MB) with a fixed number of
+# TRANSITION markers (and "TRANSITIONS" words in the text, which are not
+# markers) are segmented once and rebuilt with one transition per marker.
+# The report compares utils.layout (segment + Document.rebuild) with the
+# former split("TRANSITION") + string concatenation, and gives the time per
+# MB of each size, which stays flat when the cost is linear.
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from benchmarks.run import SENTENCES
+from utils.layout import rebuild_article_with_transitions, segment
+from utils.version import compute_version_hash, VERSION_FILES
+
+# Sentence sometimes added to paragraphs: the word TRANSITIONS is not a marker
+DECOY = "Les TRANSITIONS énergétiques locales avancent."
+
+TRANSITION_TEXT = "Pendant ce temps, ailleurs aussi"
+
+
+def make_dossier(rng, size_mb, markers):
+    """
+    Synthetic dossier of about size_mb MB (UTF-8) with 'markers' markers.
+    """
+    target = int(size_mb * 1024 * 1024)
+    sentences = SENTENCES + (DECOY,)
+    per_paragraph = max(1, target // (markers + 1))
+    paragraphs = []
+    for _ in range(markers + 1):
+        chunk = []
+        size = 0
+        while size < per_paragraph:
+            sentence = rng.choice(sentences)
+            chunk.append(sentence)
+            size += len(sentence.encode("utf-8")) + 1
+        paragraphs.append(" ".join(chunk))
+    return "\nTRANSITION\n".join(paragraphs)
+
+
+def split_and_concatenate(text, transitions):
+    # Former approach: split on the substring, then += for each marker
+    parts = text.split("TRANSITION")
+    rebuilt = parts[0].strip()
+    for i, t in enumerate(transitions[:len(parts) - 1]):
+        rebuilt += f"\n\n{t}\n\n{parts[i + 1].strip()}"
+    return len(parts) - 1, rebuilt
+
+
+def segment_and_rebuild(text, transitions):
+    document = segment(text)
+    rebuilt, _ = rebuild_article_with_transitions(document, transitions)
+    return len(document), rebuilt
+
+
+def best_of(fn, repeat, *args):
+    """
+    Fastest of 'repeat' runs (seconds) and the last result.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    transitions = [TRANSITION_TEXT] * args.markers
+    rows = []
+    for size_mb in args.sizes:
+        text = make_dossier(rng, size_mb, args.markers)
+        mb = len(text.encode("utf-8")) / (1024 * 1024)
+        baseline, (baseline_markers, _) = best_of(split_and_concatenate, args.repeat, text, transitions)
+        current, (markers, rebuilt) = best_of(segment_and_rebuild, args.repeat, text, transitions)
+        if markers != args.markers or rebuilt.count(TRANSITION_TEXT) != args.markers:
+            raise AssertionError(f"{markers} markers found, {args.markers} expected")
+        rows.append({
+            "size_mb": round(mb, 2),
+            "markers": markers,
+            "markers_found_by_split": baseline_markers,
+            "split_concat_ms": baseline * 1000,
+            "segment_rebuild_ms": current * 1000,
+            "segment_rebuild_ms_per_mb": current * 1000 / mb,
+            "speedup": baseline / current if current else None,
+        })
+        print(
+            f"{mb:7.2f} MB: split+concat {baseline * 1000:8.1f} ms, "
+            f"segment+rebuild {current * 1000:8.1f} ms ({current * 1000 / mb:.1f} ms/MB)",
+            file=sys.stderr,
+        )
+    return {
+        "version": compute_version_hash(VERSION_FILES),
+        "python": platform.python_version(),
+        "config": {"sizes": args.sizes, "markers": args.markers, "repeat": args.repeat, "seed": args.seed},
+        "results": rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark segmentation and reconstruction of large articles.")
+    parser.add_argument("--sizes", default="1,2,4,8", help="Comma-separated dossier sizes, in MB.")
+    parser.add_argument("--markers", type=int, default=500, help="TRANSITION markers per dossier.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measure (the fastest is kept).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="-", help="Where to write the JSON report ('-' = stdout).")
+    args = parser.parse_args(argv)
+    args.sizes = [float(s) for s in args.sizes.split(",") if s.strip()]
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# benchmarks/mock_server.py
+#
+# Local stand-in for the /generate endpoint, for benchmarks and offline runs.
+# It also serves an OpenAI-compatible /v1/chat/completions for the OpenAI
+# SDK backend (BACKEND = "openai" with API_URL = its base URL).
+#
+#   python -m benchmarks.mock_server --port 8765 --latency lognormal:300,0.5 --error-rate 0.02
+#
+# It answers the three kinds of prompts the app sends (single transition,
+# batched JSON array of transitions, title/blurb) in any of the response
+# shapes the client parses, and can inject latency, 5xx errors, 429s with
+# Retry-After, malformed bodies, and bad transitions (wrong length, or a
+# stock transition that collides with the other slots).
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SHAPES = ("response", "choices", "generations", "output")
+
+# Vocabulary for fake 5-word transitions (5 distinct words each)
+WORDS = (
+    "Passons ensuite à un autre sujet important local régional "
+    "voici maintenant les dernières nouvelles du jour côté actualité "
+    "enfin notons également cette information notable"
+).split()
+
+_BATCH_RE = re.compile(r"tableau JSON de (\d+)")
+
+# Answer given for injected duplicates
+STOCK_TRANSITION = "Passons maintenant au point suivant"
+
+
+def parse_latency(spec):
+    """
+    Build a latency sampler (returns seconds) from a spec string:
+    'fixed:MS', 'uniform:MIN_MS,MAX_MS', 'lognormal:MEDIAN_MS,SIGMA'
+    or 'exponential:MEAN_MS'.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0] / 1000 if values else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = values[0] / 1000, values[1]
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    if kind == "exponential":
+        return lambda: random.expovariate(1000.0 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockBackend:
+    """
+    Behaviour of the mock endpoint, shared by all request handler threads.
+    """
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, rate_limit_rate=0.0,
+                 malformed_rate=0.0, shape="response", retry_after=1.0, seed=None,
+                 invalid_rate=0.0, duplicate_rate=0.0):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.shape = shape
+        self.retry_after = retry_after
+        self.invalid_rate = invalid_rate
+        self.duplicate_rate = duplicate_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        with self._lock:
+            return self.random.random()
+
+    def transition(self):
+        with self._lock:
+            roll = self.random.random()
+            if roll < self.invalid_rate:
+                return " ".join(self.random.sample(WORDS, 2))
+            if roll < self.invalid_rate + self.duplicate_rate:
+                return STOCK_TRANSITION
+            return " ".join(self.random.sample(WORDS, 5))
+
+    def answer(self, prompt):
+        match = _BATCH_RE.search(prompt)
+        if match:
+            return json.dumps([self.transition() for _ in range(int(match.group(1)))], ensure_ascii=False)
+        if "Chapeau :" in prompt and "Paragraphe:" in prompt:
+            return "Titre : Un titre de test généré localement\nChapeau : Un chapeau de test, neutre et court."
+        return self.transition()
+
+    def wrap(self, text):
+        shape = self.shape if self.shape != "random" else SHAPES[int(self._roll() * len(SHAPES))]
+        if shape == "choices":
+            return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+        if shape == "generations":
+            return {"generations": [{"text": text}]}
+        return {shape: text}
+
+    def _fault(self, malformed):
+        # Wait the drawn latency, then maybe answer with an injected fault
+        self.requests = next(self._counter)
+        time.sleep(max(0.0, self.latency()))
+
+        roll = self._roll()
+        if roll < self.error_rate:
+            return 500, {}, b"Internal Server Error"
+        roll -= self.error_rate
+        if roll < self.rate_limit_rate:
+            return 429, {"Retry-After": str(self.retry_after)}, b"Too Many Requests"
+        roll -= self.rate_limit_rate
+        if roll < self.malformed_rate:
+            return 200, {"Content-Type": "application/json"}, malformed
+        return None
+
+    def handle(self, body):
+        """
+        Return (status, headers, body bytes) for one request.
+        """
+        fault = self._fault(b'{"response": "tronqu')
+        if fault is not None:
+            return fault
+
+        try:
+            prompt = json.loads(body).get("prompt", "")
+        except ValueError:
+            return 400, {}, b"Bad Request"
+        data = json.dumps(self.wrap(self.answer(prompt)), ensure_ascii=False).encode("utf-8")
+        return 200, {"Content-Type": "application/json"}, data
+
+
+    def handle_chat(self, body):
+        """
+        Same as handle, for an OpenAI-compatible chat completion request
+        (structured outputs and SSE streaming included).
+        """
+        fault = self._fault(b'{"id": "mock", "choices": [{"message": {"content": "tronqu')
+        if fault is not None:
+            return fault
+
+        try:
+            request = json.loads(body)
+            prompt = request["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return 400, {}, b"Bad Request"
+        text = self.answer(prompt)
+        schema = ((request.get("response_format") or {}).get("json_schema") or {}).get("name")
+        if schema == "transitions":
+            text = json.dumps({"transitions": json.loads(text) if text.startswith("[") else [text]}, ensure_ascii=False)
+        elif schema == "title_blurb":
+            lines = dict(line.split(" : ", 1) for line in text.split("\n") if " : " in line)
+            text = json.dumps({"titre": lines.get("Titre", ""), "chapeau": lines.get("Chapeau", "")}, ensure_ascii=False)
+
+        completion_id = f"chatcmpl-mock-{self.requests}"
+        model = request.get("model", "mock")
+        if request.get("stream"):
+            events = []
+            for start in range(0, len(text), 8):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {"content": text[start:start + 8]}, "finish_reason": None}],
+                }
+                events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            events.append("data: [DONE]\n\n")
+            return 200, {"Content-Type": "text/event-stream"}, "".join(events).encode("utf-8")
+
+        completion = {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
+        return 200, {"Content-Type": "application/json"}, json.dumps(completion, ensure_ascii=False).encode("utf-8")
+
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.endswith("/chat/completions"):
+                status, headers, data = backend.handle_chat(body)
+            else:
+                status, headers, data = backend.handle(body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def start_server(backend, host="127.0.0.1", port=0):
+    """
+    Serve the backend in a daemon thread. Returns (server, url).
+    Port 0 picks a free port.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/generate"
+
+
+def openai_base_url(url):
+    """
+    OpenAI-compatible base URL of a mock server, from its /generate URL.
+    """
+    return url.rsplit("/", 1)[0] + "/v1"
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:300,0.4",
+                        help="fixed:MS, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA or exponential:MEAN (milliseconds).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of 500 responses.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of 429 responses.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of truncated JSON bodies.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Share of 2-word transitions.")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Share of transitions repeating a stock one.")
+    parser.add_argument("--shape", choices=SHAPES + ("random",), default="response")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s.")
+
+
+def backend_from_args(args, seed=None):
+    return MockBackend(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        shape=args.shape,
+        retry_after=args.retry_after,
+        seed=seed,
+        invalid_rate=args.invalid_rate,
+        duplicate_rate=args.duplicate_rate,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock /generate endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server, url = start_server(backend_from_args(args), args.host, args.port)
+    print(f"Mock backend listening on {url} (OpenAI base URL: {openai_base_url(url)})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# benchmarks/run.py
+#
+# Offline benchmark of the generation pipeline against the local mock backend.
+#
+#   python -m benchmarks.run --articles 200 --concurrency 8 -o bench.json
+#   python -m benchmarks.run --mode batch --error-rate 0.05 --rate-limit-rate 0.05
+#   python -m benchmarks.run --candidates 1,3 --invalid-rate 0.1 --duplicate-rate 0.1
+#   python -m benchmarks.run --endpoints 3 --hedge --latency lognormal:300,0.8
+#   python -m benchmarks.run --backend openai --candidates 3
+#
+# Synthetic articles with 1-50 TRANSITION markers go through the full
+# pipeline (generate_article + rebuild_article_with_transitions). The report
+# (JSON) holds per-article latency percentiles, HTTP requests per article and
+# throughput, keyed by the app's version hash so runs can be compared.
+# Several --candidates values run the same articles once per value and
+# add a before/after comparison of re-asks, retries and p95 latency.
+
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import add_backend_arguments, backend_from_args, openai_base_url, start_server
+from utils.backends import make_client, BACKENDS
+from utils.client import build_session
+from utils.events import fanout, notify, span
+from utils.engine import generate_article, DEFAULT_MAX_WORKERS, GENERATION_MODES, SAMPLERS
+from utils.io import load_example_store
+from utils.layout import rebuild_article_with_transitions, segment
+from utils.metrics import Metrics
+from utils.prompts import DEFAULT_TOKEN_BUDGET
+from utils.resilience import CircuitBreaker
+from utils.router import Router
+from utils.validation import get_candidate_pool, repair_transitions
+from utils.version import compute_version_hash, VERSION_FILES
+
+SENTENCES = (
+    "Le conseil municipal de Valréas a voté le budget primitif mardi soir.",
+    "Deux girafes venues de Suède sont arrivées au zoo des Sables-d'Olonne.",
+    "Les travaux de la rue Kléber dureront jusqu'à la fin du mois de juin.",
+    "Un concert caritatif est organisé samedi à la salle des fêtes de Soullans.",
+    "Le club de pelote basque d'Itxassou accueille le trophée Atharri.",
+    "La préfecture a déclenché une alerte orange aux orages pour la nuit.",
+    "Une exposition consacrée aux objets personnels de Charles de Gaulle ouvre à Lille.",
+    "Les agriculteurs de la vallée manifesteront devant la sous-préfecture.",
+)
+
+
+def make_article(rng, markers):
+    """
+    Synthetic article: markers + 1 paragraphs of 2-4 sentences.
+    """
+    paragraphs = [" ".join(rng.sample(SENTENCES, rng.randint(2, 4))) for _ in range(markers + 1)]
+    return "\nTRANSITION\n".join(paragraphs)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile (q in 0-100) of a non-empty list.
+    """
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(q / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    if not values:
+        return {}
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+class RequestCounter:
+    """
+    Observer counting the HTTP requests of one article: first tries, client
+    retries (429/5xx/timeouts), and re-asks (a new call for a slot whose
+    answer was unusable or repeated another slot).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.reasks = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        kind = event["kind"]
+        with self._lock:
+            if kind == "request":
+                self.requests += 1
+                if event.get("attempt", 1) > 1:
+                    self.reasks += 1
+            elif kind == "retry":
+                self.requests += 1
+                self.retries += 1
+            elif kind == "repair" and event["action"] in ("regenerate", "batch_fallback"):
+                self.reasks += event.get("count", 1)
+
+
+def run_article(client, examples, text, args, metrics, candidates):
+    counter = RequestCounter()
+    observer = fanout(counter, metrics)
+    started = time.perf_counter()
+    document = segment(text)
+    _, transitions = generate_article(
+        document.parts, examples, client,
+        max_workers=args.max_workers, sampler=args.sampler, mode=args.mode,
+        observer=observer, deadline=args.deadline, token_budget=args.token_budget,
+        candidates=candidates,
+    )
+    with span(observer, "repair"):
+        transitions, repairs = repair_transitions(transitions, get_candidate_pool(examples))
+    for r in repairs:
+        notify(observer, "repair", source="benchmark", action=r.action)
+    with span(observer, "rebuild"):
+        _, error = rebuild_article_with_transitions(document, transitions)
+    return {
+        "seconds": time.perf_counter() - started,
+        "markers": len(document),
+        "requests": counter.requests,
+        "retries": counter.retries,
+        "reasks": counter.reasks,
+        "error": error,
+    }
+
+
+def run_benchmark(args, candidates=1):
+    backends = [backend_from_args(args, seed=args.seed + i) for i in range(max(1, args.endpoints))]
+    servers = [start_server(backend) for backend in backends]
+
+    rng = random.Random(args.seed)
+    articles = [make_article(rng, rng.randint(args.min_markers, args.max_markers)) for _ in range(args.articles)]
+    examples = load_example_store(args.examples)
+
+    session = build_session(pool_maxsize=args.concurrency * args.max_workers)
+    # Private breakers so injected errors don't leak into other runs
+    clients = [
+        make_client(
+            args.backend,
+            {"url": openai_base_url(url) if args.backend == "openai" else url, "token": None},
+            model="mock", session=session, breaker=CircuitBreaker(),
+        )
+        for _, url in servers
+    ]
+    client = clients[0] if len(clients) == 1 else Router(clients, hedge=args.hedge)
+
+    metrics = Metrics()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda text: run_article(client, examples, text, args, metrics, candidates), articles))
+    elapsed = time.perf_counter() - started
+    for server, _ in servers:
+        server.shutdown()
+
+    return {
+        "version": compute_version_hash(VERSION_FILES),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {
+            "articles": args.articles,
+            "markers": [args.min_markers, args.max_markers],
+            "concurrency": args.concurrency,
+            "max_workers": args.max_workers,
+            "mode": args.mode,
+            "sampler": args.sampler,
+            "deadline": args.deadline,
+            "token_budget": args.token_budget,
+            "candidates": candidates,
+            "seed": args.seed,
+            "client_backend": args.backend,
+            "endpoints": len(backends),
+            "hedge": args.hedge,
+            "backend": {
+                "latency": args.latency,
+                "error_rate": args.error_rate,
+                "rate_limit_rate": args.rate_limit_rate,
+                "malformed_rate": args.malformed_rate,
+                "invalid_rate": args.invalid_rate,
+                "duplicate_rate": args.duplicate_rate,
+                "shape": args.shape,
+            },
+        },
+        "elapsed_seconds": elapsed,
+        "articles_per_second": len(results) / elapsed if elapsed else 0.0,
+        "latency_seconds": summarize([r["seconds"] for r in results]),
+        "requests_per_article": summarize([r["requests"] for r in results]),
+        "retries_per_article": summarize([r["retries"] for r in results]),
+        "reasks_per_article": summarize([r["reasks"] for r in results]),
+        "prompt_tokens_per_request": (
+            metrics.counter("payload_tokens_total") / max(1, metrics.counter("requests_total"))
+        ),
+        "stages_seconds": metrics.stages(),
+        "repairs": {
+            c["labels"]["action"]: c["value"]
+            for c in metrics.to_json()["counters"] if c["name"].endswith("_repairs_total")
+        },
+        "backend_requests": sum(backend.requests for backend in backends),
+        "failovers": metrics.counter("failovers_total"),
+        "hedges": metrics.counter("hedges_total"),
+        "hedge_wins": metrics.counter("hedge_wins_total"),
+        "errors": sum(1 for r in results if r["error"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the transition pipeline.")
+    parser.add_argument("--articles", type=int, default=50)
+    parser.add_argument("--min-markers", type=int, default=1)
+    parser.add_argument("--max-markers", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4, help="Articles processed at the same time.")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Concurrent API calls per article.")
+    parser.add_argument("--mode", choices=GENERATION_MODES, default="parallel")
+    parser.add_argument("--sampler", choices=SAMPLERS, default="random")
+    parser.add_argument("--deadline", type=float, default=0, help="Time budget per article in seconds (0 = none).")
+    parser.add_argument("--candidates", default="1",
+                        help="Transitions requested per call; a comma-separated list (e.g. 1,3) compares them.")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Estimated token budget of each per-pair prompt.")
+    parser.add_argument("--backend", choices=BACKENDS, default="http", help="Client backend talking to the mock endpoints.")
+    parser.add_argument("--endpoints", type=int, default=1, help="Mock endpoints to route requests over.")
+    parser.add_argument("--hedge", action="store_true", help="Hedge requests still pending past an endpoint's p95 latency.")
+    parser.add_argument("--examples", default="transitions.json")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("-o", "--output", default="-", help="Where to write the JSON report ('-' = stdout).")
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    counts = [max(1, int(c)) for c in args.candidates.split(",") if c.strip()]
+    if len(counts) == 1:
+        report = run_benchmark(args, counts[0])
+    else:
+        runs = [run_benchmark(args, c) for c in counts]
+        report = {
+            "version": runs[0]["version"],
+            "timestamp": runs[0]["timestamp"],
+            "comparison": [
+                {
+                    "candidates": run["config"]["candidates"],
+                    "reasks_per_article": run["reasks_per_article"]["mean"],
+                    "retries_per_article": run["retries_per_article"]["mean"],
+                    "requests_per_article": run["requests_per_article"]["mean"],
+                    "latency_p95_seconds": run["latency_seconds"]["p95"],
+                    "prompt_tokens_per_request": run["prompt_tokens_per_request"],
+                }
+                for run in runs
+            ],
+            "runs": runs,
+        }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# utils/backends.py
+#
+# Generation backends behind the ApiClient interface: the plain HTTP
+# endpoint (ApiClient itself) and the OpenAI SDK (AsyncOpenAI, any
+# OpenAI-compatible base URL). The OpenAI backend uses structured outputs
+# for JSON answers and always returns {"response": text}, so callers never
+# have to guess the shape of an answer.
+
+import asyncio
+import concurrent.futures
+import json
+import re
+import threading
+
+import requests
+
+from utils.cache import CachedResponse
+from utils.client import ApiClient, auth_headers
+
+BACKENDS = ("http", "openai")
+
+DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
+
+# JSON schemas of the structured answers a payload can ask for ("schema")
+RESPONSE_SCHEMAS = {
+    "transitions": {
+        "type": "object",
+        "properties": {"transitions": {"type": "array", "items": {"type": "string"}}},
+        "required": ["transitions"],
+        "additionalProperties": False,
+    },
+    "title_blurb": {
+        "type": "object",
+        "properties": {"titre": {"type": "string"}, "chapeau": {"type": "string"}},
+        "required": ["titre", "chapeau"],
+        "additionalProperties": False,
+    },
+}
+
+# A JSON string field, possibly cut short by streaming
+_PARTIAL_FIELD_RE = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+_runner = None
+_runner_lock = threading.Lock()
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+
+
+class AsyncRunner:
+    """
+    Event loop running in a daemon thread. Worker threads hand it
+    coroutines and wait for their result, so every call of the process
+    shares one loop and the async client's connection pool.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-backend", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise requests.exceptions.Timeout("No answer from the backend in time")
+
+
+def get_async_runner():
+    """
+    Process-wide event loop thread, started on first use.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = AsyncRunner()
+        return _runner
+
+
+def get_async_openai(base_url=None, api_key=None):
+    """
+    Process-wide AsyncOpenAI client per base URL and key. Its own retries
+    are off: ApiClient's retry policy and circuit breaker apply instead.
+    """
+    from openai import AsyncOpenAI
+
+    with _openai_clients_lock:
+        client = _openai_clients.get((base_url, api_key))
+        if client is None:
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key or "none", max_retries=0)
+            _openai_clients[(base_url, api_key)] = client
+        return client
+
+
+def structured_text(schema, raw, partial=False):
+    """
+    Text callers expect from a structured answer: a JSON array for
+    "transitions", the "Titre : ...\\nChapeau : ..." lines for
+    "title_blurb". Unreadable answers are returned as they are, for the
+    callers' usual validation. With 'partial', 'raw' is a streamed prefix.
+    """
+    if schema == "title_blurb":
+        if partial:
+            fields = {}
+            for name, value in _PARTIAL_FIELD_RE.findall(raw):
+                try:
+                    fields[name] = json.loads(f'"{value.rstrip(chr(92))}"')
+                except ValueError:
+                    fields[name] = value
+        else:
+            try:
+                fields = json.loads(raw)
+            except ValueError:
+                return raw.strip()
+            if not isinstance(fields, dict):
+                return raw.strip()
+        lines = [f"Titre : {fields['titre']}"] if "titre" in fields else []
+        if "chapeau" in fields:
+            lines.append(f"Chapeau : {fields['chapeau']}")
+        return "\n".join(lines)
+    if schema == "transitions" and not partial:
+        try:
+            items = json.loads(raw)["transitions"]
+        except (ValueError, KeyError, TypeError):
+            return raw.strip()
+        return json.dumps(items, ensure_ascii=False)
+    return raw if partial else raw.strip()
+
+
+class OpenAIBackend(ApiClient):
+    """
+    ApiClient sending prompts as chat completions through the OpenAI SDK.
+
+    All threads share one AsyncOpenAI client driven by one event loop, so
+    concurrent calls are multiplexed over the same connection pool. The
+    response cache, coalescing, retries, circuit breaker and deadline are
+    ApiClient's.
+
+    Parameters:
+    - url (str, optional): OpenAI-compatible base URL (e.g. a local stand-in
+      server's ".../v1"); None for the OpenAI API.
+    - api_key (str, optional): API key of that server.
+    - model (str): Chat model to use (part of the cache key).
+    - client (AsyncOpenAI, optional): Defaults to the process-wide one for
+      this URL and key.
+    - runner (AsyncRunner, optional): Defaults to the process-wide one.
+    - Other parameters as for ApiClient.
+    """
+
+    structured = True
+
+    def __init__(self, url=None, api_key=None, model=DEFAULT_OPENAI_MODEL, client=None, runner=None, **kwargs):
+        base_url = url.rstrip("/") if url else None
+        super().__init__(
+            f"{base_url or 'https://api.openai.com/v1'}/chat/completions",
+            headers=auth_headers(api_key), model=model, **kwargs
+        )
+        self.client = client if client is not None else get_async_openai(base_url, api_key)
+        self.runner = runner if runner is not None else get_async_runner()
+
+    def _transport(self, payload, timeout, on_text):
+        import openai
+
+        # One overall timeout for the SDK: the read timeout of a (connect, read) pair
+        timeout = max(timeout) if isinstance(timeout, tuple) else timeout
+        try:
+            text = self.runner.run(self._complete(payload, timeout, on_text), timeout=timeout + 1)
+        except openai.APIStatusError as e:
+            # Same handling as an HTTP error status (retried on 429/5xx)
+            return CachedResponse(e.response.text, status_code=e.status_code, from_cache=False, headers=e.response.headers)
+        except openai.APITimeoutError as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except openai.APIConnectionError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        return CachedResponse(json.dumps({"response": text}, ensure_ascii=False), status_code=200, from_cache=False)
+
+    async def _complete(self, payload, timeout, on_text):
+        schema = payload.get("schema")
+        request = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": payload["prompt"]}],
+            "timeout": timeout,
+        }
+        if schema is not None:
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema, "schema": RESPONSE_SCHEMAS[schema], "strict": True},
+            }
+
+        if on_text is None:
+            completion = await self.client.chat.completions.create(**request)
+            return structured_text(schema, completion.choices[0].message.content or "")
+
+        raw = ""
+        stream = await self.client.chat.completions.create(stream=True, **request)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                raw += chunk.choices[0].delta.content
+                text = structured_text(schema, raw, partial=True)
+                if text:
+                    on_text(text)
+        return structured_text(schema, raw)
+
+
+def make_client(backend, endpoint, model=None, **kwargs):
+    """
+    Client of one endpoint ({"url", "token"}, see utils.router.parse_endpoints)
+    for the given backend ("http" or "openai"; 'model' is only sent by the
+    latter). Other arguments go to the client (session, timeout, cache,
+    retry_policy, semaphore...).
+    """
+    if backend == "openai":
+        # The SDK has its own connection pool
+        kwargs.pop("session", None)
+        return OpenAIBackend(endpoint["url"], api_key=endpoint["token"], model=model or DEFAULT_OPENAI_MODEL, **kwargs)
+    return ApiClient(endpoint["url"], headers=auth_headers(endpoint["token"]), **kwargs)
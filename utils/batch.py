@@ -0,0 +1,310 @@
+# utils/batch.py
+#
+# Headless batch pipeline: generate titles, blurbs and transitions for whole
+# directories (or JSONL streams) of articles without the Streamlit UI.
+#
+#   python -m utils.batch articles/ -o results.jsonl --workers 4 --rate 5
+#   cat articles.jsonl | python -m utils.batch - -o results.jsonl
+#
+# Results are appended to the output JSONL one article at a time, and
+# articles already completed in that file are skipped on the next run.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from utils.cache import ResponseCache
+from utils.backends import make_client, BACKENDS
+from utils.client import RateLimiter, SingleFlight, build_session, DEFAULT_TIMEOUT
+from utils.events import EventLog, fanout, notify, span
+from utils.engine import generate_article, DEFAULT_ARTICLE_DEADLINE, DEFAULT_MAX_WORKERS, GENERATION_MODES, SAMPLERS
+from utils.io import load_example_store
+from utils.layout import rebuild_article_with_transitions, segment
+from utils.metrics import JsonEventLogger, Metrics
+from utils.prompts import DEFAULT_TOKEN_BUDGET
+from utils.validation import get_candidate_pool, repair_transitions
+from utils.router import Router, parse_endpoints
+from utils.title_blurb import failure_message
+
+ARTICLE_EXTENSIONS = (".txt", ".md")
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+# Set per worker (thread pool: once in the main process, process pool: once per process)
+_worker = {}
+
+
+def load_secrets(path=SECRETS_PATH):
+    """
+    Read API credentials from the Streamlit secrets file, if present.
+    """
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except (ImportError, OSError, ValueError):
+        return {}
+
+
+def iter_articles(source):
+    """
+    Yield (article_id, text) pairs from a directory of .txt/.md files,
+    a JSONL file, or '-' for a JSONL stream on stdin.
+    JSONL lines must hold {"id": ..., "text": ...}.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if name.endswith(ARTICLE_EXTENSIONS) and os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    yield os.path.splitext(name)[0], f.read()
+        return
+
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield str(record.get("id", line_number)), record["text"]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def completed_ids(output_path):
+    """
+    IDs of the articles already written to the output without error.
+    A truncated last line (crash mid-write) is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get("error"):
+                done.add(str(record["id"]))
+    return done
+
+
+def _init_worker(config):
+    cache = ResponseCache(config["cache"]) if config["cache"] else None
+    rate_limiter = RateLimiter(config["rate"], burst=config["rate"]) if config["rate"] else None
+    semaphore = threading.BoundedSemaphore(config["max_outstanding"]) if config["max_outstanding"] else None
+    # Every article sharing this client can have 'concurrency' calls in
+    # flight, so size the pool for all of them (capped by the outstanding
+    # limit) and no keep-alive connection is discarded
+    pool_maxsize = max(config["concurrency"], 1) * config.get("articles_per_client", 1)
+    if config["max_outstanding"]:
+        pool_maxsize = min(pool_maxsize, config["max_outstanding"])
+    session = build_session(pool_maxsize=max(pool_maxsize, 1))
+    endpoints = config["endpoints"]
+    if len(endpoints) == 1:
+        _worker["client"] = make_client(
+            config["backend"],
+            endpoints[0],
+            model=config["model"],
+            session=session,
+            timeout=config["timeout"],
+            cache=cache,
+            rate_limiter=rate_limiter,
+            single_flight=SingleFlight(),
+            semaphore=semaphore,
+        )
+    else:
+        _worker["client"] = Router(
+            [
+                make_client(
+                    config["backend"],
+                    ep,
+                    model=config["model"],
+                    session=session,
+                    timeout=config["timeout"],
+                    rate_limiter=rate_limiter,
+                    semaphore=semaphore,
+                )
+                for ep in endpoints
+            ],
+            weights=[ep["weight"] for ep in endpoints],
+            hedge=config["hedge"],
+            cache=cache,
+            model=config["model"],
+            single_flight=SingleFlight(),
+        )
+    _worker["examples"] = load_example_store(config["examples"])
+    _worker["config"] = config
+    # Appended to by every worker: one JSON event per line
+    _worker["event_log"] = (
+        JsonEventLogger(open(config["event_log"], "a", encoding="utf-8")) if config.get("event_log") else None
+    )
+
+
+def process_article(article_id, text):
+    """
+    Generate everything for one article. Returns the output record, with
+    the article's metrics (Metrics.to_json) under "_metrics".
+    """
+    config = _worker["config"]
+    started = time.time()
+    record = {"id": article_id}
+    metrics = Metrics()
+    events = EventLog()
+    observer = fanout(metrics, events, _worker["event_log"])
+    try:
+        document = segment(text)
+        if not len(document):
+            raise ValueError("Aucune balise TRANSITION trouvée.")
+        title_blurb, transitions = generate_article(
+            document.parts,
+            _worker["examples"],
+            _worker["client"],
+            max_workers=config["concurrency"],
+            sampler=config["sampler"],
+            mode=config["mode"],
+            deadline=config["deadline"],
+            token_budget=config["token_budget"],
+            candidates=config["candidates"],
+            observer=observer,
+        )
+        with span(observer, "repair"):
+            transitions, repairs = repair_transitions(transitions, get_candidate_pool(_worker["examples"]))
+        for r in repairs:
+            notify(observer, "repair", source="batch", action=r.action)
+        with span(observer, "rebuild"):
+            article, error = rebuild_article_with_transitions(document, transitions)
+        if error:
+            raise ValueError(error)
+        record.update(
+            title_blurb=title_blurb, transitions=transitions, article=article,
+            repairs=[r._asdict() for r in repairs],
+        )
+        if title_blurb is None:
+            record["title_error"] = failure_message(events.snapshot())
+    except Exception as e:
+        record["error"] = str(e)
+    record["seconds"] = round(time.time() - started, 3)
+    record["_metrics"] = metrics.to_json()
+    return record
+
+
+def run(config, source, output_path, workers=1, executor="thread", log=sys.stderr, metrics=None):
+    """
+    Process every article from source not already completed in output_path,
+    appending one JSON line per article as soon as it is done.
+    The per-article metrics are merged into 'metrics', if given.
+    Returns (processed, failed) counts.
+    """
+    done = completed_ids(output_path)
+    articles = [(i, t) for i, t in iter_articles(source) if i not in done]
+    if done:
+        print(f"Skipping {len(done)} article(s) already completed.", file=log)
+
+    if executor == "process":
+        # Each process gets its own client, so split the global rate evenly
+        worker_config = dict(
+            config,
+            rate=config["rate"] / workers if config["rate"] else 0,
+            max_outstanding=max(1, config["max_outstanding"] // workers) if config["max_outstanding"] else 0,
+        )
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(worker_config,))
+    else:
+        # One client shared by every thread
+        _init_worker(dict(config, articles_per_client=workers))
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    processed = failed = 0
+    with pool, open(output_path, "a", encoding="utf-8") as out:
+        futures = [pool.submit(process_article, article_id, text) for article_id, text in articles]
+        for future in as_completed(futures):
+            record = future.result()
+            article_metrics = record.pop("_metrics")
+            if metrics is not None:
+                metrics.merge(article_metrics)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            processed += 1
+            if record.get("error"):
+                failed += 1
+                print(f"✗ {record['id']}: {record['error']}", file=log)
+            else:
+                print(f"✓ {record['id']} ({record['seconds']} s)", file=log)
+    return processed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Générateur de transitions françaises, mode batch (sans interface).")
+    parser.add_argument("source", help="Directory of .txt/.md articles, a JSONL file, or '-' for JSONL on stdin.")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL file (appended to, used for resume).")
+    parser.add_argument("--workers", type=int, default=4, help="Articles processed at the same time.")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_WORKERS, help="Concurrent API calls per article.")
+    parser.add_argument("--rate", type=float, default=0, help="Global limit on API requests per second (0 = none).")
+    parser.add_argument("--max-outstanding", type=int, default=0, help="Global cap on requests in flight at once (0 = none).")
+    parser.add_argument("--mode", choices=GENERATION_MODES, default="parallel")
+    parser.add_argument("--sampler", choices=SAMPLERS, default="random")
+    parser.add_argument("--candidates", type=int, default=1, help="Transitions requested per call, best one kept.")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Estimated token budget of each per-pair prompt.")
+    parser.add_argument("--examples", default="transitions.json")
+    parser.add_argument("--cache", default="", help="Path of a response cache to use (disabled by default).")
+    parser.add_argument("--api-url", action="append", default=None,
+                        help="Backend endpoint; repeat it to balance requests over several endpoints.")
+    parser.add_argument("--api-token", default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="'http' (POST a prompt) or 'openai' (OpenAI SDK, --api-url being the base URL).")
+    parser.add_argument("--model", default=None, help="Model of the openai backend.")
+    parser.add_argument("--hedge", action="store_true",
+                        help="With several endpoints, duplicate requests still pending past an endpoint's p95 latency.")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT[1], help="Read timeout in seconds.")
+    parser.add_argument("--metrics", default="", help="Write run metrics here: Prometheus text, or JSON for *.json.")
+    parser.add_argument("--event-log", default="", help="Append every event as a JSON line to this file.")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_ARTICLE_DEADLINE, help="Time budget per article in seconds (0 = none).")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets()
+    api_token = args.api_token or os.environ.get("API_TOKEN") or secrets.get("API_TOKEN")
+    endpoints = parse_endpoints(
+        args.api_url or os.environ.get("API_ENDPOINTS") or secrets.get("API_ENDPOINTS"),
+        os.environ.get("API_URL") or secrets.get("API_URL"),
+        api_token,
+    )
+    if not endpoints:
+        parser.error("API URL not found. Use --api-url, the API_URL environment variable or .streamlit/secrets.toml.")
+
+    config = {
+        "endpoints": endpoints,
+        "hedge": args.hedge,
+        "backend": args.backend or os.environ.get("BACKEND") or secrets.get("BACKEND") or "http",
+        "model": args.model or os.environ.get("OPENAI_MODEL") or secrets.get("OPENAI_MODEL"),
+        "timeout": (DEFAULT_TIMEOUT[0], args.timeout),
+        "concurrency": max(1, args.concurrency),
+        "rate": max(0.0, args.rate),
+        "max_outstanding": max(0, args.max_outstanding),
+        "mode": args.mode,
+        "sampler": args.sampler,
+        "examples": args.examples,
+        "token_budget": args.token_budget,
+        "candidates": max(1, args.candidates),
+        "cache": args.cache,
+        "deadline": max(0.0, args.deadline),
+        "event_log": args.event_log,
+    }
+    workers = max(1, args.workers)
+    metrics = Metrics()
+    processed, failed = run(config, args.source, args.output, workers=workers, executor=args.executor, metrics=metrics)
+    if args.metrics:
+        metrics.write(args.metrics)
+    print(f"{processed} article(s) processed, {failed} failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+# utils/client.py
+
+import copy
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.cache import CachedResponse, make_cache_key
+from utils.events import notify
+from utils.resilience import RATE_LIMITED, CircuitOpenError, Deadline, DeadlineExceeded, RetryPolicy, get_breaker, parse_retry_after
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 35)
+
+# Number of per-host pools kept, and max keep-alive connections per host
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+
+# Max requests outstanding at once to the backend, for the whole server process
+DEFAULT_MAX_OUTSTANDING = 32
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def build_session(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+    """
+    Build a requests.Session whose connections are kept alive and reused.
+
+    Parameters:
+    - pool_connections (int): Number of distinct hosts to keep a pool for.
+    - pool_maxsize (int): Max connections kept open per host. Should be at
+      least the number of concurrent workers, otherwise extra connections
+      are opened and thrown away.
+    - pool_block (bool): Block instead of opening extra connections when
+      the per-host pool is exhausted.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def auth_headers(api_token=None):
+    """
+    JSON request headers, with a bearer token when one is given.
+    """
+    headers = {"Content-Type": "application/json"}
+    if api_token:
+        headers["Authorization"] = f"Bearer {api_token}"
+    return headers
+
+
+def get_default_session():
+    """
+    Return a process-wide pooled session, built on first use.
+    Used when callers only pass a bare API URL.
+    """
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = build_session()
+        return _default_session
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread using it: at most 'rate' requests
+    per second on average, with bursts of up to 'burst' requests.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: while a call for a key is running,
+    other callers with the same key wait for it and share its result (or
+    exception) instead of making their own call.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() unless a call for 'key' is already in flight, in which case
+        wait (at most 'timeout' seconds) for that call instead.
+        Returns (result, shared): shared is True when another caller ran fn.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise DeadlineExceeded("Time budget spent waiting for an identical request")
+            if isinstance(flight.error, DeadlineExceeded):
+                # The leader ran out of its own budget, ours may not be spent
+                return fn(), False
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+class ApiClient:
+    """
+    Generation endpoint bound to a shared, pooled HTTP session.
+
+    Parameters:
+    - url (str): The API URL to POST to.
+    - headers (dict, optional): Headers for every request, including auth.
+    - session (requests.Session, optional): Pooled session to reuse.
+    - timeout (float or tuple): Default (connect, read) timeout.
+    - cache (ResponseCache, optional): Response cache consulted before any POST.
+    - read_cache (bool): Set to False to bypass cached responses (they are
+      still refreshed with the new ones).
+    - model (str, optional): Model name, part of the cache key.
+    - rate_limiter (RateLimiter, optional): Global limit on requests actually
+      sent to the API (cache hits are not counted).
+    - retry_policy (RetryPolicy, optional): Backoff for 429/5xx, timeouts and
+      connection errors. Defaults to RetryPolicy().
+    - breaker (CircuitBreaker, optional): Defaults to the process-wide
+      breaker of this URL.
+    - deadline (Deadline, optional): Total time budget for every call made
+      through this client (see with_deadline).
+    - single_flight (SingleFlight, optional): Shared by clients whose
+      identical concurrent requests should be sent only once.
+    - semaphore (threading.Semaphore, optional): Shared cap on the requests
+      outstanding at the same time (held while sending, not during backoff).
+
+    Other backends subclass it and override _transport (one request over
+    the wire), keeping the cache, coalescing, retries and deadline.
+    """
+
+    # Whether payloads may carry a "schema" (see utils.backends.RESPONSE_SCHEMAS)
+    structured = False
+
+    def __init__(self, url, headers=None, session=None, timeout=DEFAULT_TIMEOUT,
+                 cache=None, read_cache=True, model=None, rate_limiter=None,
+                 retry_policy=None, breaker=None, deadline=None, single_flight=None, semaphore=None):
+        self.url = url
+        self.headers = headers if headers is not None else {"Content-Type": "application/json"}
+        self.session = session if session is not None else get_default_session()
+        self.timeout = timeout
+        self.cache = cache
+        self.read_cache = read_cache
+        self.model = model
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker = breaker if breaker is not None else get_breaker(url)
+        self.deadline = deadline
+        self.single_flight = single_flight
+        self.semaphore = semaphore
+
+    def with_deadline(self, seconds):
+        """
+        Copy of this client (same session, cache, breaker) whose calls all
+        share a budget of 'seconds' from now.
+        """
+        clone = copy.copy(self)
+        clone.deadline = Deadline(seconds)
+        return clone
+
+    def post(self, payload, timeout=None, use_cache=True, on_text=None, observer=None):
+        """
+        POST the payload, answering from the response cache when possible.
+        Only 200 responses are stored. Pass use_cache=False on retries so a
+        cached response that was rejected isn't served again.
+
+        429/5xx responses, timeouts and connection errors are retried with
+        exponential backoff and jitter (honoring Retry-After), within the
+        deadline. Raises CircuitOpenError when the endpoint's breaker is
+        open and DeadlineExceeded when the budget is spent; once retries are
+        exhausted the last error response is returned or exception raised.
+
+        With 'on_text', the backend is asked to stream ("stream": true) and
+        on_text(text_so_far) is called as SSE/chunked tokens arrive. The
+        returned response then carries the reassembled text as
+        {"response": text}.
+
+        With a single_flight, a request identical to one already in flight
+        (from any thread or session) waits for it and shares its response.
+        """
+        key = None
+        if self.cache is not None or self.single_flight is not None:
+            key = make_cache_key(payload, url=self.url, model=self.model)
+        if self.cache is not None:
+            if use_cache and self.read_cache:
+                body = self.cache.get(key)
+                if body is not None:
+                    response = CachedResponse(body)
+                    if on_text is not None:
+                        on_text(response_text(response))
+                    return response
+
+        timeout = timeout if timeout is not None else self.timeout
+        if self.single_flight is None:
+            return self._send(payload, key, timeout, on_text, observer)
+
+        response, shared = self.single_flight.do(
+            key,
+            lambda: self._send(payload, key, timeout, on_text, observer),
+            timeout=self.deadline.remaining() if self.deadline is not None else None,
+        )
+        if shared:
+            notify(observer, "coalesced", url=self.url)
+            if on_text is not None:
+                on_text(response_text(response))
+        return response
+
+    def _send(self, payload, key, timeout, on_text, observer):
+        # Retry loop around one request, see post()
+        policy = self.retry_policy
+        attempt = 0
+        while True:
+            if self.deadline is not None and self.deadline.expired():
+                raise DeadlineExceeded(f"Time budget spent before calling {self.url}")
+            if not self.breaker.allow():
+                notify(observer, "circuit_open", url=self.url)
+                raise CircuitOpenError(f"Circuit open for {self.url}")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            self._acquire_slot(observer)
+            send_timeout = self.deadline.clamp(timeout) if self.deadline is not None else timeout
+            try:
+                response = self._transport(payload, send_timeout, on_text)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                delay = policy.delay(attempt)
+                if not self._can_retry(attempt, delay):
+                    raise
+                notify(observer, "retry", url=self.url, attempt=attempt + 1, error=type(e).__name__, delay=delay)
+            else:
+                if response.status_code not in policy.retry_statuses:
+                    self.breaker.record_success()
+                    if self.cache is not None and response.status_code == 200:
+                        self.cache.set(key, response.text)
+                    return response
+                # Rate limiting is the backend working as intended, not a failure
+                if response.status_code != RATE_LIMITED:
+                    self.breaker.record_failure()
+                delay = policy.delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                if not self._can_retry(attempt, delay):
+                    return response
+                notify(observer, "retry", url=self.url, attempt=attempt + 1, status=response.status_code, delay=delay)
+                response.close()
+            finally:
+                if self.semaphore is not None:
+                    self.semaphore.release()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _transport(self, payload, timeout, on_text):
+        # One request over the wire, streamed into on_text when given
+        if on_text is None:
+            return self.session.post(self.url, json=payload, headers=self.headers, timeout=timeout)
+        return self._post_streaming(payload, timeout, on_text)
+
+    def _acquire_slot(self, observer):
+        # Wait for room under the process-wide cap on outstanding requests
+        if self.semaphore is None:
+            return
+        if self.semaphore.acquire(blocking=False):
+            return
+        started = time.perf_counter()
+        remaining = self.deadline.remaining() if self.deadline is not None else None
+        if not self.semaphore.acquire(timeout=remaining):
+            raise DeadlineExceeded(f"Time budget spent waiting to call {self.url}")
+        notify(observer, "span", stage="queue_wait", seconds=time.perf_counter() - started)
+
+    def _can_retry(self, attempt, delay):
+        if delay is None or attempt + 1 >= self.retry_policy.max_attempts:
+            return False
+        remaining = self.deadline.remaining() if self.deadline is not None else None
+        return remaining is None or remaining > delay
+
+    def _post_streaming(self, payload, timeout, on_text):
+        response = self.session.post(
+            self.url,
+            json=dict(payload, stream=True),
+            headers=self.headers,
+            timeout=timeout,
+            stream=True,
+        )
+        content_type = response.headers.get("Content-Type", "")
+        if response.status_code != 200 or "json" in content_type:
+            # Backend answered in one piece, nothing to stream
+            return response
+
+        text = ""
+        with response:
+            if "event-stream" in content_type:
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    text += _delta_text(data)
+                    on_text(text)
+            else:
+                response.encoding = response.encoding or "utf-8"
+                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                    text += chunk
+                    on_text(text)
+        return CachedResponse(json.dumps({"response": text}), status_code=200, from_cache=False)
+
+
+def _delta_text(data):
+    """
+    Text carried by one SSE event, for the streaming formats we know.
+    """
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(event, str):
+        return event
+    if not isinstance(event, dict):
+        return ""
+    if "choices" in event and event["choices"]:
+        choice = event["choices"][0]
+        return (choice.get("delta") or {}).get("content") or choice.get("text") or ""
+    for field in ("response", "token", "text", "output"):
+        if isinstance(event.get(field), str):
+            return event[field]
+    return ""
+
+
+def response_text(response):
+    """
+    Generated text of a response. Backends other than the plain HTTP one
+    always answer {"response": text}; the other shapes are the ones seen
+    from HTTP endpoints (OpenAI-like, Anthropic-like, generic "output").
+    """
+    try:
+        result = response.json()
+    except ValueError:
+        return response.text.strip()
+    if isinstance(result, str):
+        return result.strip()
+    if not isinstance(result, dict):
+        return str(result)
+    if isinstance(result.get("response"), str):
+        return result["response"].strip()
+    if result.get("choices"):
+        return result["choices"][0]["message"]["content"].strip()
+    if result.get("generations"):
+        return result["generations"][0]["text"].strip()
+    if isinstance(result.get("output"), str):
+        return result["output"].strip()
+    return str(result)
+
+
+def as_client(client, headers=None):
+    """
+    Accept either an ApiClient or a bare API URL (legacy callers).
+    """
+    if isinstance(client, ApiClient):
+        return client
+    return ApiClient(client, headers=headers)
@@ -0,0 +1,283 @@
+# utils/corpus.py
+#
+# Compiled, memory-mapped form of the example dataset, for corpora too big
+# to parse into Python dicts in every worker:
+#
+#   python -m utils.corpus transitions.json        # -> transitions.corpus/
+#
+# The directory holds every string in one UTF-8 blob with an offset index,
+# the transition word counts and leading words, the similarity index
+# (TF-IDF matrix) and the top candidate transitions, as .npy arrays opened
+# with mmap: pages are shared read-only by every process on the machine,
+# and only the rows actually sampled are decoded.
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections.abc import Sequence
+
+import numpy as np
+
+from utils.io import corpus_path_for
+from utils.prompts import leading_word
+from utils.retrieval import DEFAULT_DIMS, INDEX_VERSION, SimilarityIndex, _counts
+from utils.validation import CandidatePool
+
+# Bump when the layout changes, so older compiled corpora are ignored
+CORPUS_VERSION = 2
+
+# Dataset transitions kept for the candidate pool (an article has <= 50 slots)
+MAX_POOL_TRANSITIONS = 500
+
+# Rows featurized at a time while compiling
+COMPILE_CHUNK = 10000
+
+
+def compile_corpus(source_path, output_dir=None, dims=DEFAULT_DIMS):
+    """
+    Compile a JSON dataset of {input, transition} pairs into a corpus
+    directory (default: next to it, ".corpus" instead of ".json").
+
+    The corpus is built in a temporary sibling directory, then renamed into
+    place: files of the previous corpus are never rewritten, so processes
+    that still have them memory-mapped keep reading the old data (writing
+    to a mapped file that shrinks kills its readers with SIGBUS).
+
+    Returns the output directory.
+    """
+    output_dir = os.path.abspath(output_dir or corpus_path_for(source_path))
+    parent, name = os.path.split(output_dir)
+    build_dir = tempfile.mkdtemp(prefix=f".{name}.", suffix=".tmp", dir=parent)
+    # mkdtemp makes it private to this user; corpora are read by every process
+    os.chmod(build_dir, 0o755)
+    try:
+        _build_corpus(source_path, build_dir, dims)
+        _swap_in(build_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    return output_dir
+
+
+def _swap_in(build_dir, output_dir):
+    # rename() can't replace a non-empty directory: move the old corpus
+    # aside first, then delete it. Its files are unlinked, not truncated,
+    # so existing mappings stay valid until their readers close them.
+    old_dir = None
+    if os.path.exists(output_dir):
+        old_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_dir)}.", suffix=".old", dir=os.path.dirname(output_dir))
+        os.replace(output_dir, os.path.join(old_dir, "corpus"))
+    os.replace(build_dir, output_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _build_corpus(source_path, output_dir, dims):
+    # Write every file of a corpus into the new, empty directory 'output_dir'.
+    # The similarity matrix is written in chunks straight to its mmap file.
+    meta_path = os.path.join(output_dir, "meta.json")
+    stat = os.stat(source_path)
+    with open(source_path, "rb") as f:
+        data = f.read()
+    source_md5 = hashlib.md5(data).hexdigest()
+    examples = json.loads(data.decode("utf-8"))
+    del data
+    n = len(examples)
+
+    # Strings: input i at offsets[2i], its transition at offsets[2i + 1]
+    offsets = np.zeros(2 * n + 1, dtype=np.int64)
+    with open(os.path.join(output_dir, "strings.bin"), "wb") as f:
+        position = 0
+        for i, ex in enumerate(examples):
+            for j, text in enumerate((ex["input"], ex["transition"])):
+                encoded = text.encode("utf-8")
+                f.write(encoded)
+                position += len(encoded)
+                offsets[2 * i + j + 1] = position
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+
+    # Word-count buckets (file order kept inside a bucket, as in ExampleStore)
+    word_counts = np.array([len(ex["transition"].split()) for ex in examples], dtype=np.int16)
+    by_word_count = np.argsort(word_counts, kind="stable").astype(np.int64)
+    np.save(os.path.join(output_dir, "word_counts.npy"), word_counts)
+    np.save(os.path.join(output_dir, "by_word_count.npy"), by_word_count)
+
+    # Leading-word buckets, words numbered by first appearance
+    vocabulary = {}
+    leading_ids = np.array(
+        [vocabulary.setdefault(leading_word(ex["transition"]), len(vocabulary)) for ex in examples],
+        dtype=np.int32,
+    )
+    np.save(os.path.join(output_dir, "leading_ids.npy"), leading_ids)
+    by_leading_word = np.argsort(leading_ids, kind="stable").astype(np.int64)
+    np.save(os.path.join(output_dir, "by_leading_word.npy"), by_leading_word)
+    np.save(os.path.join(output_dir, "sorted_leading_ids.npy"), leading_ids[by_leading_word])
+
+    # Similarity index rows in word-count order, as SimilarityIndex.build
+    matrix = np.lib.format.open_memmap(
+        os.path.join(output_dir, "matrix.npy"), mode="w+", dtype=np.float32, shape=(n, dims)
+    )
+    df = np.zeros(dims, dtype=np.int64)
+    for start in range(0, n, COMPILE_CHUNK):
+        rows = by_word_count[start:start + COMPILE_CHUNK]
+        counts = np.stack([_counts(examples[i]["input"], dims) for i in rows]) if len(rows) else np.zeros((0, dims))
+        df += np.count_nonzero(counts, axis=0)
+        matrix[start:start + len(rows)] = counts
+    idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+    for start in range(0, n, COMPILE_CHUNK):
+        block = np.log1p(matrix[start:start + COMPILE_CHUNK]) * idf
+        block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        matrix[start:start + COMPILE_CHUNK] = block
+    matrix.flush()
+    del matrix
+    np.save(os.path.join(output_dir, "idf.npy"), idf)
+    np.save(os.path.join(output_dir, "sorted_word_counts.npy"), word_counts[by_word_count])
+
+    pool = CandidatePool(ex["transition"] for ex in examples)
+    meta = {
+        "version": CORPUS_VERSION,
+        "index_version": INDEX_VERSION,
+        "count": n,
+        "dims": dims,
+        "source": {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "md5": source_md5},
+        "leading_words": list(vocabulary),
+        "pool_transitions": pool.ranked[:MAX_POOL_TRANSITIONS],
+    }
+    # Written last: a corpus without meta.json is incomplete and ignored
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def read_meta(corpus_dir):
+    """
+    The corpus' meta.json, or None if missing, unreadable or of another version.
+    """
+    try:
+        with open(os.path.join(corpus_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CORPUS_VERSION or meta.get("index_version") != INDEX_VERSION:
+        return None
+    return meta
+
+
+class _Rows(Sequence):
+    """
+    Read-only sequence of examples decoded on access, optionally through a
+    permutation (a bucket). Works with random.sample, slicing, iteration.
+    """
+
+    def __init__(self, corpus, positions=None):
+        self.corpus = corpus
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions) if self.positions is not None else len(self.corpus)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.corpus.row(int(self.positions[i]) if self.positions is not None else i)
+
+
+class CompiledExampleStore:
+    """
+    ExampleStore over a compiled corpus directory: same interface, but
+    examples stay on disk (memory-mapped) and are decoded only when read.
+    """
+
+    def __init__(self, corpus_dir, meta=None, source_path=None):
+        meta = meta if meta is not None else read_meta(corpus_dir)
+        if meta is None:
+            raise ValueError(f"Not a compiled corpus: {corpus_dir}")
+        self.corpus_dir = corpus_dir
+        self.source_path = source_path
+        self.count = meta["count"]
+        self.leading_words = {w: i for i, w in enumerate(meta["leading_words"])}
+        self.pool_transitions = meta["pool_transitions"]
+
+        def load(name):
+            return np.load(os.path.join(corpus_dir, name), mmap_mode="r")
+
+        strings_path = os.path.join(corpus_dir, "strings.bin")
+        # numpy can't map an empty file
+        self.strings = np.memmap(strings_path, dtype=np.uint8, mode="r") if os.path.getsize(strings_path) else b""
+        self.offsets = load("offsets.npy")
+        self.word_counts = load("word_counts.npy")
+        self.by_word_count = load("by_word_count.npy")
+        self.leading_ids = load("leading_ids.npy")
+        self.by_leading_word = load("by_leading_word.npy")
+        self.sorted_leading_ids = load("sorted_leading_ids.npy")
+        self.sorted_word_counts = load("sorted_word_counts.npy")
+        self.examples = _Rows(self)
+        # Prebuilt: utils.retrieval.get_index returns it as is
+        self.similarity_index = SimilarityIndex(
+            load("matrix.npy"), load("idf.npy"), self.sorted_word_counts, self.by_word_count,
+        )
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.examples)
+
+    def _text(self, k):
+        return bytes(self.strings[self.offsets[k]:self.offsets[k + 1]]).decode("utf-8")
+
+    def row(self, i):
+        return {"input": self._text(2 * i), "transition": self._text(2 * i + 1)}
+
+    def _slice(self, sorted_keys, order, key):
+        lo = int(np.searchsorted(sorted_keys, key, side="left"))
+        hi = int(np.searchsorted(sorted_keys, key, side="right"))
+        return _Rows(self, order[lo:hi])
+
+    def bucket(self, word_count=None, leading_word=None):
+        """
+        Return the (lazy, read-only) sequence of examples matching the filter.
+        """
+        if word_count is not None:
+            return self._slice(self.sorted_word_counts, self.by_word_count, word_count)
+        if leading_word is not None:
+            word_id = self.leading_words.get(leading_word.lower())
+            if word_id is None:
+                return []
+            return self._slice(self.sorted_leading_ids, self.by_leading_word, word_id)
+        return self.examples
+
+    def sample(self, k, word_count=None, leading_word=None, rng=random):
+        """
+        Pick k examples from the matching bucket, falling back to the whole
+        corpus when the bucket holds fewer than k examples. Only the picked
+        rows are decoded.
+        """
+        pool = self.bucket(word_count=word_count, leading_word=leading_word)
+        if len(pool) < k:
+            pool = self.examples
+        return rng.sample(pool, min(k, len(pool)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the example dataset into a memory-mapped corpus.")
+    parser.add_argument("source", nargs="?", default="transitions.json")
+    parser.add_argument("-o", "--output", default=None, help="Corpus directory (default: SOURCE with .corpus).")
+    parser.add_argument("--dims", type=int, default=DEFAULT_DIMS, help="Size of the hashed similarity features.")
+    args = parser.parse_args(argv)
+
+    output_dir = compile_corpus(args.source, args.output, dims=args.dims)
+    print(f"Corpus compiled to {output_dir} ({read_meta(output_dir)['count']} examples)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
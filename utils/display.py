@@ -16,3 +16,111 @@ def show_warning_or_error(missing=False, not_enough=False):
 
 def show_version(version_hash):
     st.caption(f"🔄 Version de l'application : `{version_hash}`")
+
+def show_live_preview(placeholder, title_blurb, article, transitions):
+    """
+    Render the article while it is being generated, inside a st.empty()
+    placeholder. Pending transitions are shown as ⏳.
+    """
+    with placeholder.container():
+        if title_blurb:
+            st.markdown("### 📰 Titre et chapeau")
+            st.text(title_blurb)
+        st.markdown("### 🧾 Article (génération en cours)")
+        st.text(article)
+        st.markdown("### 🧩 Transitions générées")
+        for i, t in enumerate(transitions, 1):
+            st.markdown(f"{i}. _{t}_" if t else f"{i}. ⏳")
+
+def show_repairs(repairs):
+    """
+    Report the fixes made by utils.validation.repair_transitions.
+    """
+    duplicates = [r.before for r in repairs if r.action == "duplicate"]
+    if duplicates:
+        st.warning(f"🚨 Transitions répétées détectées: {', '.join(duplicates)}")
+
+    invalid_word_count = [
+        f"Transition {r.index + 1}: '{r.before}'" for r in repairs if r.action in ("truncate", "pad", "replace")
+    ]
+    for r in repairs:
+        if r.action == "truncate":
+            st.info(f"Transition {r.index + 1} raccourcie à 5 mots: '{r.after}'")
+        elif r.action == "pad":
+            st.info(f"Transition {r.index + 1} complétée à 5 mots: '{r.after}'")
+        elif r.action == "replace":
+            st.info(f"Transition {r.index + 1} remplacée: '{r.after}'")
+        elif r.action == "repeated_word":
+            st.info(f"Transition {r.index + 1} répète un mot: '{r.after}'")
+    if invalid_word_count:
+        st.warning(f"🚨 Transitions qui ne respectaient pas la règle de 5 mots: {', '.join(invalid_word_count)}")
+
+# Expander titles of the debug events, by source
+DEBUG_REQUEST_TITLES = {
+    "title": "API Debug Info (Expand to see details)",
+    "transition": "API Transition Debug (Expand to see details)",
+    "batch": "API Batch Transition Debug (Expand to see details)",
+}
+DEBUG_RESPONSE_TITLES = {
+    "title": "API Response (Expand to see details)",
+    "transition": "API Response for Transition (Expand to see details)",
+    "batch": "API Response for Batch (Expand to see details)",
+}
+
+def show_debug_events(events):
+    """
+    Streamlit subscriber for the generation core: render the events marked
+    as debug (see utils.events) as expanders.
+    """
+    for event in events:
+        if not event.get("debug"):
+            continue
+        source = event.get("source")
+        if event["kind"] == "request":
+            with st.expander(DEBUG_REQUEST_TITLES.get(source, "API Debug"), expanded=False):
+                st.write("**API URL:**", event["url"])
+                st.write("**Headers:**", event["headers"])
+                st.write("**Payload:**", event["payload"])
+        elif event["kind"] == "response":
+            with st.expander(DEBUG_RESPONSE_TITLES.get(source, "API Response"), expanded=False):
+                st.write("**Status Code:**", event["status"])
+                st.write("**Time:**", f"{event['seconds']:.2f} s" + (" (cache)" if event.get("from_cache") else ""))
+                if isinstance(event.get("content"), str):
+                    st.write("**Raw Response:**", event["content"])
+                else:
+                    st.write("**Response Content:**", event.get("content"))
+
+def show_metrics_summary(metrics):
+    """
+    Per-stage timings and repair counters of one run, as a small table.
+    """
+    stages = metrics.stages()
+    if not stages:
+        st.write("Aucune mesure pour cette exécution.")
+        return
+    st.table([
+        {
+            "Étape": stage,
+            "Appels": row["count"],
+            "Total (s)": f"{row['total']:.3f}",
+            "Moyenne (ms)": f"{row['mean'] * 1000:.1f}",
+            "Max (ms)": f"{row['max'] * 1000:.1f}",
+        }
+        for stage, row in sorted(stages.items(), key=lambda item: -item[1]["total"])
+    ])
+    st.write(
+        "**Requêtes:**", metrics.counter("requests_total"),
+        "— **Tokens/requête:**", metrics.counter("payload_tokens_total") // max(1, metrics.counter("requests_total")),
+        "— **Retries:**", metrics.counter("retries_total"),
+        "— **Partagées:**", metrics.counter("coalesced_total"),
+        "— **Réutilisées:**", metrics.counter("reused_total", kind="transition"),
+        "— **Réparations:**",
+        ", ".join(
+            f"{action} × {metrics.counter('repairs_total', action=action)}"
+            for action in (
+                "truncate", "pad", "replace", "duplicate", "repeated_word",
+                "fallback", "alternate", "regenerate", "batch_fallback",
+            )
+            if metrics.counter("repairs_total", action=action)
+        ) or "aucune",
+    )
@@ -0,0 +1,303 @@
+# utils/engine.py
+
+import hashlib
+import queue
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.client import as_client
+from utils.events import notify, span
+from utils.processing import FALLBACK_TRANSITIONS, get_transition_candidates, get_transition_from_gpt, get_transitions_batch
+from utils.prompts import DEFAULT_TOKEN_BUDGET
+from utils.title_blurb import TitleBlurbError, generate_title_and_blurb
+from utils.validation import choose_unique, find_duplicate_slots
+
+# Default number of API calls allowed in flight at the same time
+DEFAULT_MAX_WORKERS = 8
+
+# Default time budget (seconds) for all the calls of one article
+DEFAULT_ARTICLE_DEADLINE = 120
+
+# "parallel": one request per pair, "batch": one request for the whole article
+GENERATION_MODES = ("parallel", "batch")
+
+# Few-shot example samplers: "random", or "similar" (TF-IDF nearest
+# examples, the only one that loads utils.retrieval and NumPy)
+SAMPLERS = ("random", "similar")
+
+# How often (seconds) progress updates are replayed on the calling thread
+UPDATE_INTERVAL = 0.05
+
+# How many targeted re-generation passes we do for colliding transitions
+MAX_RECONCILE_ROUNDS = 2
+
+
+def _text_key(*paragraphs):
+    joined = "\0".join(p.strip() for p in paragraphs)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+class ArticleMemo:
+    """
+    Accepted title/blurb and transitions of the last article, keyed by a
+    hash of the paragraphs they depend on: the first paragraph for the
+    title, the (paragraph before, paragraph after) pair for a transition.
+    """
+
+    def __init__(self):
+        self.title_key = None
+        self.title_blurb = None
+        self.transitions = {}
+
+    def lookup(self, parts):
+        """
+        Return (title_blurb or None, list with the known transition or None
+        for each pair) for an article split on its markers.
+        """
+        title = self.title_blurb if self.title_key == _text_key(parts[0]) else None
+        return title, [self.transitions.get(_text_key(a, b)) for a, b in zip(parts[:-1], parts[1:])]
+
+    def remember(self, parts, title_blurb, transitions, repairs=()):
+        """
+        Keep the accepted results of this article (and forget older ones).
+        Only what the backend actually generated is kept: a missing title
+        (None), the fallback transitions and the transitions replaced from
+        the candidate pool ('repairs', see utils.validation) are asked
+        again next time.
+        """
+        replaced = {r.index for r in repairs if r.action in ("replace", "duplicate")}
+        self.title_key = _text_key(parts[0]) if title_blurb is not None else None
+        self.title_blurb = title_blurb
+        self.transitions = {
+            _text_key(a, b): t
+            for i, ((a, b), t) in enumerate(zip(zip(parts[:-1], parts[1:]), transitions))
+            if i not in replaced and t not in FALLBACK_TRANSITIONS
+        }
+
+    def clear(self):
+        self.__init__()
+
+
+class _Progress:
+    """
+    Collects results (and streamed partial text) from worker threads and
+    replays them on the calling thread, where it's safe to update the UI.
+    """
+
+    def __init__(self, on_update, stream):
+        self.on_update = on_update
+        self.stream = stream
+        self.updates = queue.SimpleQueue()
+
+    def partial(self, kind, index):
+        # Callback handed to workers for token streaming, if enabled
+        if self.on_update is None or not self.stream:
+            return None
+        return lambda text: self.updates.put((kind, index, text, False))
+
+    def done(self, kind, index, text):
+        if self.on_update is not None:
+            self.updates.put((kind, index, text, True))
+
+    def track(self, future, kind, index=None, pick=None):
+        # 'pick' extracts the text to show from the result (e.g. the best candidate)
+        if self.on_update is not None:
+            def _on_done(f):
+                if not f.cancelled() and f.exception() is None:
+                    result = f.result()
+                    self.done(kind, index, pick(result) if pick is not None else result)
+            future.add_done_callback(_on_done)
+        return future
+
+    def wait(self, futures):
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=UPDATE_INTERVAL, return_when=FIRST_COMPLETED)
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        if self.on_update is None:
+            return
+        # Only the latest update per slot is replayed, streamed tokens pile up fast
+        latest = {}
+        while True:
+            try:
+                kind, index, text, done = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            latest.pop((kind, index), None)
+            latest[(kind, index)] = (text, done)
+        for (kind, index), (text, done) in latest.items():
+            self.on_update(kind, index, text, done)
+
+
+def _regenerate_slots(pool, progress, slots, transitions, pairs, examples, client, headers, sampler, observer, token_budget, candidates):
+    # Re-generate the given slots in parallel, each one told which transitions
+    # are already taken by the other slots
+    futures = {
+        i: progress.track(
+            pool.submit(
+                get_transition_from_gpt, pairs[i][0], pairs[i][1], examples, client,
+                headers=headers,
+                previous_transitions=[t for j, t in enumerate(transitions) if j != i and t],
+                show_debug=False,
+                sampler=sampler,
+                on_partial=progress.partial("transition", i),
+                observer=observer,
+                token_budget=token_budget,
+                candidates=candidates,
+            ),
+            "transition", i,
+        )
+        for i in slots
+    }
+    progress.wait(futures.values())
+    for i, future in futures.items():
+        transitions[i] = future.result()
+
+
+def generate_article(parts, examples, client, headers=None, max_workers=DEFAULT_MAX_WORKERS,
+                     sampler="random", mode="parallel", on_update=None, stream=False, observer=None,
+                     deadline=None, token_budget=DEFAULT_TOKEN_BUDGET, candidates=1, memo=None):
+    """
+    Generate the title/blurb and every transition of an article concurrently.
+
+    All requests are fired at once on a bounded thread pool, so the latency is
+    roughly the slowest call instead of the sum of all calls. Since the
+    transitions no longer see each other while being generated, repeated
+    transitions are reconciled afterwards by re-generating only the colliding
+    slots, with every other accepted transition passed as "already used".
+
+    With candidates > 1 every call asks for that many transitions at once.
+    They are scored locally, and repeated transitions are first resolved by
+    switching slots to their next-best candidate, without another call.
+
+    In "batch" mode all transitions are requested in a single call alongside
+    the title/blurb call, and per-pair calls are only made for the slots the
+    batched answer failed to fill.
+
+    Parameters:
+    - parts (list of str): The article split on 'TRANSITION' markers.
+    - examples (ExampleStore or list of dict): Few-shot examples.
+    - client (ApiClient or str): The API client, or a bare API URL.
+    - headers (dict, optional): Headers for the API request, including auth.
+    - max_workers (int): Maximum number of concurrent API calls.
+    - sampler (str): Few-shot example sampler, "random" or "similar".
+    - mode (str): "parallel" (one call per pair) or "batch" (one call per article).
+    - on_update (callable, optional): Called on the calling thread as
+      on_update(kind, index, text, done) each time the title ("title", None)
+      or a transition ("transition", i) completes or is replaced.
+    - stream (bool): Also stream tokens from the backend, calling on_update
+      with done=False and the partial text as it arrives.
+    - observer (callable, optional): Receives request/response/error events
+      from every call, plus stage timings ("span") and "repair" counts
+      (see utils.events). Called from worker threads.
+    - deadline (float, optional): Total time budget in seconds for the
+      article. Calls that would overrun it give up and use the fallbacks.
+    - token_budget (int): Estimated token budget of each per-pair prompt
+      (see utils.prompts); long paragraphs are windowed to fit.
+    - candidates (int): Transitions requested per call (1 = a single one).
+    - memo (ArticleMemo, optional): Accepted results of a previous run. The
+      title and the transitions whose paragraphs haven't changed are reused
+      as is; only the other ones are generated, told to avoid the reused ones.
+
+    Returns:
+    - str or None: The generated title and blurb, None if it failed (the
+      reason is reported to the observer as an "error" event).
+    - list of str: One transition per paragraph pair.
+    """
+    pairs = list(zip(parts[:-1], parts[1:]))
+    progress = _Progress(on_update, stream)
+
+    if deadline:
+        client = as_client(client, headers).with_deadline(deadline)
+
+    # ✅ Reuse what was accepted for unchanged paragraphs, call only for the rest
+    if memo is not None:
+        title_blurb, transitions = memo.lookup(parts)
+        notify(
+            observer, "reuse", title=title_blurb is not None,
+            transitions=sum(t is not None for t in transitions), total=len(pairs),
+        )
+    else:
+        title_blurb, transitions = None, [None] * len(pairs)
+    kept = [i for i, t in enumerate(transitions) if t is not None]
+    todo = [i for i, t in enumerate(transitions) if t is None]
+    kept_transitions = [transitions[i] for i in kept]
+    for i in kept:
+        progress.done("transition", i, transitions[i])
+    if title_blurb is not None:
+        progress.done("title", None, title_blurb)
+
+    with span(observer, "article", mode=mode), ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        title_future = None
+        if title_blurb is None:
+            title_future = progress.track(
+                pool.submit(
+                    generate_title_and_blurb, parts[0], client, headers,
+                    on_partial=progress.partial("title", None), observer=observer,
+                ),
+                "title",
+            )
+
+        if todo and mode == "batch":
+            batch_future = pool.submit(
+                get_transitions_batch, [pairs[i] for i in todo], examples, client,
+                headers=headers, show_debug=True, sampler=sampler, observer=observer,
+                token_budget=token_budget,
+            )
+            progress.wait([batch_future])
+            for i, t in zip(todo, batch_future.result()):
+                transitions[i] = t
+                if t is not None:
+                    progress.done("transition", i, t)
+
+            # ✅ Fall back to per-pair calls only for slots that failed validation
+            missing = [i for i in todo if transitions[i] is None]
+            if missing:
+                notify(observer, "repair", source="batch", action="batch_fallback", count=len(missing))
+                _regenerate_slots(pool, progress, missing, transitions, pairs, examples, client, headers, sampler, observer, token_budget, candidates)
+        elif todo:
+            futures = [
+                progress.track(
+                    pool.submit(
+                        get_transition_candidates, pairs[i][0], pairs[i][1], examples, client,
+                        headers=headers, previous_transitions=kept_transitions or None,
+                        show_debug=(i == todo[0]), sampler=sampler,
+                        on_partial=progress.partial("transition", i), observer=observer,
+                        token_budget=token_budget, candidates=candidates,
+                    ),
+                    "transition", i, pick=lambda ranked: ranked[0],
+                )
+                for i in todo
+            ]
+            progress.wait(futures)
+            ranked_lists = [f.result() for f in futures]
+
+            # ✅ Resolve repeats locally with each slot's next-best candidate
+            chosen = choose_unique(ranked_lists, taken=kept_transitions)
+            swapped = [i for i, t, ranked in zip(todo, chosen, ranked_lists) if t != ranked[0]]
+            for i, t in zip(todo, chosen):
+                transitions[i] = t
+            if swapped:
+                notify(observer, "repair", source="engine", action="alternate", count=len(swapped))
+                for i in swapped:
+                    progress.done("transition", i, transitions[i])
+
+        # ✅ Re-generate only the new slots that repeat another transition
+        for _ in range(MAX_RECONCILE_ROUNDS):
+            slots = find_duplicate_slots(transitions, fixed=kept)
+            if not slots:
+                break
+            notify(observer, "repair", source="engine", action="regenerate", count=len(slots))
+            with span(observer, "reconcile"):
+                _regenerate_slots(pool, progress, slots, transitions, pairs, examples, client, headers, sampler, observer, token_budget, candidates)
+
+        if title_future is not None:
+            progress.wait([title_future])
+            try:
+                title_blurb = title_future.result()
+            except TitleBlurbError:
+                title_blurb = None
+
+    return title_blurb, transitions
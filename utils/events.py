@@ -0,0 +1,87 @@
+# utils/events.py
+#
+# Observer hook for the generation core. Library code never talks to the UI:
+# it calls notify(observer, kind, **fields) and whoever passed an observer
+# (the Streamlit debug panel, a metrics collector, a log file...) decides
+# what to do with the event. An observer is any callable taking one dict.
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Body size kept in "response" events
+MAX_BODY_CHARS = 2000
+
+
+def notify(observer, kind, **fields):
+    """
+    Send one event to the observer, if there is one.
+    Every event carries 'kind' and a wall-clock 'time'.
+    """
+    if observer is not None:
+        observer(dict(fields, kind=kind, time=time.time()))
+
+
+@contextmanager
+def span(observer, stage, **fields):
+    """
+    Time the enclosed block and report it as a "span" event with its
+    'stage' name and duration in 'seconds'. Free when there's no observer.
+    """
+    if observer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        notify(observer, "span", stage=stage, seconds=time.perf_counter() - started, **fields)
+
+
+def redact_headers(headers):
+    return {k: "..." if k == "Authorization" else v for k, v in headers.items()}
+
+
+def response_content(response):
+    """
+    Decoded JSON body of a response if possible, else its (truncated) text.
+    """
+    try:
+        return response.json()
+    except ValueError:
+        return response.text[:MAX_BODY_CHARS]
+
+
+class EventLog:
+    """
+    Observer that keeps every event in order. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.events)
+
+
+def fanout(*observers):
+    """
+    Combine several observers (None entries are skipped) into one.
+    """
+    observers = [o for o in observers if o is not None]
+    if not observers:
+        return None
+    if len(observers) == 1:
+        return observers[0]
+
+    def observer(event):
+        for o in observers:
+            o(event)
+
+    return observer
@@ -1,10 +1,142 @@
 # utils/io.py
 
+import hashlib
 import json
+import os
+import random
+import sys
+import threading
+from collections import defaultdict
+
+from utils.prompts import leading_word
+from utils.version import remember_file_hash
+
+# Loaded stores, keyed by absolute path: {path: (mtime_ns, size, store)}
+_store_cache = {}
+_store_cache_lock = threading.Lock()
+
+
+def corpus_path_for(source_path):
+    """
+    Directory of the compiled corpus of a JSON dataset (see utils.corpus).
+    """
+    root, _ = os.path.splitext(source_path)
+    return root + ".corpus"
+
+
+class ExampleStore:
+    """
+    Few-shot examples pre-bucketed by transition word count and leading word,
+    so picking examples doesn't re-scan the whole dataset on every call.
+    """
+
+    def __init__(self, examples, source_path=None):
+        self.examples = list(examples)
+        self.source_path = source_path
+        # Built lazily by utils.retrieval.get_index
+        self.similarity_index = None
+        self.by_word_count = defaultdict(list)
+        self.by_leading_word = defaultdict(list)
+        for ex in self.examples:
+            self.by_word_count[len(ex["transition"].split())].append(ex)
+            self.by_leading_word[leading_word(ex["transition"])].append(ex)
+
+    def __len__(self):
+        return len(self.examples)
+
+    def __iter__(self):
+        return iter(self.examples)
+
+    def bucket(self, word_count=None, leading_word=None):
+        """
+        Return the (shared, read-only) list of examples matching the filter.
+        """
+        if word_count is not None:
+            return self.by_word_count.get(word_count, [])
+        if leading_word is not None:
+            return self.by_leading_word.get(leading_word.lower(), [])
+        return self.examples
+
+    def sample(self, k, word_count=None, leading_word=None, rng=random):
+        """
+        Pick k examples from the matching bucket, falling back to the whole
+        dataset when the bucket holds fewer than k examples.
+        """
+        pool = self.bucket(word_count=word_count, leading_word=leading_word)
+        if len(pool) < k:
+            pool = self.examples
+        return rng.sample(pool, min(k, len(pool)))
+
+
+def as_example_store(examples):
+    """
+    Accept either an ExampleStore (or any store with the same bucket/sample
+    interface, e.g. utils.corpus.CompiledExampleStore) or a plain list of
+    {input, transition} dicts.
+    """
+    if hasattr(examples, "bucket") and hasattr(examples, "sample"):
+        return examples
+    return ExampleStore(examples)
+
+
+def load_example_store(file_path="transitions.json"):
+    """
+    Load the transition dataset once per process as an ExampleStore.
+    The cached store is rebuilt only when the file's mtime or size changes.
+    The bytes read are hashed at the same time for the app version (see
+    utils.version), so the dataset is never read twice.
+
+    When a compiled corpus of the same file exists (python -m utils.corpus),
+    it is memory-mapped instead of parsing the JSON; it is also used alone
+    when the JSON file is absent. utils.corpus (and NumPy) is only imported
+    when such a corpus exists.
+    """
+    path = os.path.abspath(file_path)
+    corpus_dir = corpus_path_for(path)
+    if not os.path.exists(path) and os.path.isdir(corpus_dir):
+        return _load_compiled(corpus_dir, None)
+
+    stat = os.stat(path)
+    with _store_cache_lock:
+        cached = _store_cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        if os.path.isdir(corpus_dir):
+            from utils.corpus import CompiledExampleStore, read_meta
+            meta = read_meta(corpus_dir)
+            source = meta["source"] if meta is not None else None
+            if source is not None and (source["mtime_ns"], source["size"]) == (stat.st_mtime_ns, stat.st_size):
+                remember_file_hash(path, stat, source["md5"])
+                store = CompiledExampleStore(corpus_dir, meta, source_path=path)
+                _store_cache[path] = (stat.st_mtime_ns, stat.st_size, store)
+                return store
+            if source is not None:
+                print(f"Compiled corpus {corpus_dir} is out of date, loading {path} (run: python -m utils.corpus {file_path})", file=sys.stderr)
+        with open(path, "rb") as f:
+            data = f.read()
+        remember_file_hash(path, stat, hashlib.md5(data).hexdigest())
+        store = ExampleStore(json.loads(data.decode("utf-8")), source_path=path)
+        _store_cache[path] = (stat.st_mtime_ns, stat.st_size, store)
+        return store
+
+
+def _load_compiled(corpus_dir, source_path):
+    # Compiled corpus without its JSON source, cached on meta.json's mtime
+    stat = os.stat(os.path.join(corpus_dir, "meta.json"))
+    with _store_cache_lock:
+        cached = _store_cache.get(corpus_dir)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        from utils.corpus import CompiledExampleStore
+        store = CompiledExampleStore(corpus_dir, source_path=source_path)
+        _store_cache[corpus_dir] = (stat.st_mtime_ns, stat.st_size, store)
+        return store
+
 
 def load_examples(file_path="transitions.json"):
     """
     Load full transition dataset: list of {input, transition} pairs.
+    The list is cached and shared across calls, treat it as read-only.
+    For a compiled corpus it is a lazy sequence: rows are decoded on access.
     """
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return load_example_store(file_path).examples
@@ -0,0 +1,107 @@
+# utils/jobs.py
+#
+# Background jobs for the Streamlit app: a generation runs on a worker
+# thread of the server process instead of the script thread, so reruns
+# (widget interactions, page refreshes of the same session) neither block
+# on the backend nor abort work in progress.
+
+import itertools
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Articles generated at the same time, for the whole server process
+DEFAULT_JOB_WORKERS = 4
+
+# How often the UI polls a running job, in seconds
+DEFAULT_POLL_SECONDS = 0.5
+
+
+class Job:
+    """
+    One background task: its live progress while it runs, then its result
+    (or error). Safe to read from the script thread while a worker writes.
+    """
+
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = self.QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._progress = {}
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def update(self, name, value, index=None):
+        """
+        Set a progress field, or one item of a list field when 'index' is given.
+        """
+        with self._lock:
+            if index is None:
+                self._progress[name] = value
+            else:
+                self._progress[name][index] = value
+
+    def progress(self):
+        """
+        Copy of the progress fields (lists copied too).
+        """
+        with self._lock:
+            return {k: list(v) if isinstance(v, list) else v for k, v in self._progress.items()}
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobRunner:
+    """
+    Worker threads running jobs from an in-memory queue.
+    submit(fn, ...) queues fn(job, ...) and returns the Job right away.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="job")
+        self._ids = itertools.count(1)
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        job = Job(next(self._ids))
+        with self._lock:
+            self._active[job.id] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.started = time.time()
+        job.status = Job.RUNNING
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = Job.DONE
+        except Exception as e:
+            print(f"Job {job.id} failed: {traceback.format_exc()}", file=sys.stderr)
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                del self._active[job.id]
+
+    def active(self):
+        """
+        Number of jobs queued or running.
+        """
+        with self._lock:
+            return len(self._active)
@@ -1,24 +1,96 @@
-import streamlit as st
+MARKER = "TRANSITION"
+
+
+def _is_word_char(char):
+    # Same word characters as the \w of re: letters, digits and underscore
+    return char.isalnum() or char == "_"
+
+
+class Document:
+    """
+    An article segmented once on its TRANSITION markers, shared by
+    generation and reconstruction.
+
+    Only offsets are stored: spans[i] is the (start, end) of paragraph i in
+    'text', markers[i] the (start, end) of the marker after it. Paragraph
+    strings are sliced out on first use of 'parts'.
+    """
+
+    __slots__ = ("text", "spans", "markers", "_parts")
+
+    def __init__(self, text, spans, markers):
+        self.text = text
+        self.spans = spans
+        self.markers = markers
+        self._parts = None
+
+    def __len__(self):
+        # Number of markers, i.e. of transitions to generate
+        return len(self.markers)
+
+    @property
+    def parts(self):
+        """
+        Paragraphs around the markers (len(self) + 1 strings), as
+        str.split("TRANSITION") would give them.
+        """
+        if self._parts is None:
+            self._parts = [self.text[start:end] for start, end in self.spans]
+        return self._parts
+
+    def rebuild(self, transitions):
+        """
+        The article with each marker replaced by its transition, paragraphs
+        stripped and separated by blank lines. Built with a single join.
+        """
+        text = self.text
+        pieces = [text[self.spans[0][0]:self.spans[0][1]].strip()]
+        for t, (start, end) in zip(transitions, self.spans[1:]):
+            pieces.append(t)
+            pieces.append(text[start:end].strip())
+        return "\n\n".join(pieces)
+
+
+def segment(text):
+    """
+    Split an article on its TRANSITION markers in one pass. A marker is
+    the whole word (the r"\bTRANSITION\b" of re): "TRANSITIONS" or
+    "PRETRANSITION" are left as text. str.find does the scanning, which
+    is much faster than a regular expression on large inputs.
+
+    Returns a Document.
+    """
+    spans = []
+    markers = []
+    start = 0
+    position = text.find(MARKER)
+    while position != -1:
+        end = position + len(MARKER)
+        if not (position and _is_word_char(text[position - 1])) and not (end < len(text) and _is_word_char(text[end])):
+            spans.append((start, position))
+            markers.append((position, end))
+            start = end
+        position = text.find(MARKER, end)
+    spans.append((start, len(text)))
+    return Document(text, spans, markers)
+
 
 def rebuild_article_with_transitions(user_input, transitions):
     """
     Rebuilds the article by inserting validated transitions between paragraph segments.
 
     Parameters:
-    - user_input (str): The original article text with 'TRANSITION' markers.
+    - user_input (str or Document): The original article text with 'TRANSITION'
+      markers, or its segmented Document (to avoid segmenting it again).
     - transitions (list of str): List of transitions, one for each marker.
 
     Returns:
     - str: The reconstructed article with transitions inserted.
     - str or None: An error message if mismatch occurs, else None.
     """
-    parts = user_input.split("TRANSITION")
+    document = user_input if isinstance(user_input, Document) else segment(user_input)
 
-    if len(parts) != len(transitions) + 1:
+    if len(document) != len(transitions):
         return None, "Mismatch between number of TRANSITION markers and generated transitions."
 
-    rebuilt_article = parts[0].strip()
-    for i, t in enumerate(transitions):
-        rebuilt_article += f"\n\n{t}\n\n{parts[i + 1].strip()}"
-
-    return rebuilt_article, None
+    return document.rebuild(transitions), None
@@ -0,0 +1,262 @@
+# utils/metrics.py
+#
+# Lightweight metrics built on the observer events (see utils.events):
+# a Metrics object is an observer that turns spans, requests, retries and
+# repairs into counters and timing histograms, exportable as Prometheus text
+# or JSON. JsonEventLogger writes every event as one structured JSON line.
+
+import json
+import threading
+
+# Upper bounds (seconds) of the timing histogram buckets
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Errors reported as themselves, anything else is counted as "other"
+KNOWN_ERRORS = ("connection", "timeout", "circuit_open")
+
+METRIC_HELP = {
+    "stage_seconds": "Time spent in each stage of the pipeline.",
+    "network_seconds": "Time from sending a request to having its full answer, retries included.",
+    "requests_total": "Requests sent, by source (client retries not included).",
+    "payload_chars_total": "Characters of prompt sent, by source.",
+    "payload_tokens_total": "Estimated tokens of prompt sent, by source.",
+    "trimmed_sentences_total": "Paragraph sentences left out of prompts to fit the token budget.",
+    "responses_total": "Responses received, by source and status.",
+    "cache_hits_total": "Responses served from the response cache.",
+    "retries_total": "Requests retried by the client, by reason.",
+    "circuit_open_total": "Calls refused because the circuit breaker was open.",
+    "coalesced_total": "Requests answered by an identical request already in flight.",
+    "failovers_total": "Requests sent to another endpoint after an error.",
+    "hedges_total": "Duplicate requests sent to a second endpoint past the first one's p95 latency.",
+    "hedge_wins_total": "Hedged requests answered first by the second endpoint.",
+    "reused_total": "Titles and transitions reused from the previous run of an edited article.",
+    "errors_total": "Calls that ended in an error, by source and error.",
+    "repairs_total": "Transitions fixed after generation, by action.",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(TIME_BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(TIME_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class Metrics:
+    """
+    Observer aggregating events into counters and timing histograms.
+    Safe to share between threads, and between runs for cumulative totals.
+    """
+
+    def __init__(self, prefix="transitions"):
+        self.prefix = prefix
+        self.counters = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = _Timing()
+            timing.observe(seconds)
+
+    def __call__(self, event):
+        kind = event["kind"]
+        source = event.get("source", "")
+        if kind == "span":
+            self.observe("stage_seconds", event["seconds"], stage=event["stage"])
+        elif kind == "request":
+            self.inc("requests_total", source=source)
+            self.inc("payload_chars_total", event.get("payload_chars", 0), source=source)
+            self.inc("payload_tokens_total", event.get("payload_tokens", 0), source=source)
+            if event.get("trimmed_sentences"):
+                self.inc("trimmed_sentences_total", event["trimmed_sentences"], source=source)
+        elif kind == "response":
+            self.observe("network_seconds", event["seconds"], source=source)
+            self.inc("responses_total", source=source, status=event.get("status"))
+            if event.get("from_cache"):
+                self.inc("cache_hits_total", source=source)
+        elif kind == "retry":
+            self.inc("retries_total", reason=event.get("status") or event.get("error", "unknown"))
+        elif kind == "circuit_open":
+            self.inc("circuit_open_total")
+        elif kind == "coalesced":
+            self.inc("coalesced_total")
+        elif kind == "failover":
+            self.inc("failovers_total")
+        elif kind == "hedge":
+            self.inc("hedges_total")
+        elif kind == "hedge_won":
+            self.inc("hedge_wins_total")
+        elif kind == "reuse":
+            self.inc("reused_total", event["transitions"], kind="transition")
+            self.inc("reused_total", int(event["title"]), kind="title")
+        elif kind == "error":
+            error = event.get("error")
+            self.inc("errors_total", source=source, error=error if error in KNOWN_ERRORS else "other")
+        elif kind == "repair":
+            self.inc("repairs_total", action=event["action"], value=event.get("count", 1))
+
+    def counter(self, name, **labels):
+        """
+        Sum of a counter over every label set matching 'labels'.
+        """
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(v for (n, key), v in self.counters.items() if n == name and wanted <= set(key))
+
+    def stages(self):
+        """
+        Per-stage timing summary: {stage: {"count", "total", "mean", "max"}}.
+        Network time is listed per source as "network:<source>".
+        """
+        rows = {}
+        with self._lock:
+            for (name, key), timing in self.timings.items():
+                labels = dict(key)
+                if name == "stage_seconds":
+                    stage = labels["stage"]
+                elif name == "network_seconds":
+                    stage = f"network:{labels['source']}"
+                else:
+                    continue
+                rows[stage] = {
+                    "count": timing.count,
+                    "total": timing.total,
+                    "mean": timing.total / timing.count,
+                    "max": timing.max,
+                }
+        return rows
+
+    def to_json(self):
+        """
+        All counters and timings as a JSON-serializable dict.
+        """
+        with self._lock:
+            counters = [
+                {"name": f"{self.prefix}_{name}", "labels": dict(key), "value": value}
+                for (name, key), value in sorted(self.counters.items())
+            ]
+            timings = [
+                {
+                    "name": f"{self.prefix}_{name}", "labels": dict(key),
+                    "count": t.count, "sum": t.total, "max": t.max,
+                    "buckets": list(t.buckets),
+                }
+                for (name, key), t in sorted(self.timings.items())
+            ]
+        return {"counters": counters, "timings": timings}
+
+    def merge(self, data):
+        """
+        Add the counters and timings of another Metrics' to_json() output,
+        e.g. collected in a worker process.
+        """
+        prefix = f"{self.prefix}_"
+        for c in data["counters"]:
+            self.inc(c["name"][len(prefix):], c["value"], **c["labels"])
+        with self._lock:
+            for t in data["timings"]:
+                key = (t["name"][len(prefix):], _label_key(t["labels"]))
+                timing = self.timings.get(key)
+                if timing is None:
+                    timing = self.timings[key] = _Timing()
+                timing.count += t["count"]
+                timing.total += t["sum"]
+                timing.max = max(timing.max, t["max"])
+                timing.buckets = [a + b for a, b in zip(timing.buckets, t["buckets"])]
+
+    def to_prometheus(self):
+        """
+        All counters and timings in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted((k, (t.count, t.total, list(t.buckets))) for k, t in self.timings.items())
+
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {full} {kind}")
+
+        for (name, key), value in counters:
+            declare(name, "counter")
+            lines.append(f"{self.prefix}_{name}{_format_labels(key)} {value}")
+
+        for (name, key), (count, total, buckets) in timings:
+            declare(name, "histogram")
+            full = f"{self.prefix}_{name}"
+            cumulative = 0
+            for bound, n in zip(TIME_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{full}_bucket{_format_labels(key, [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{full}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{full}_sum{_format_labels(key)} {total}")
+            lines.append(f"{full}_count{_format_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the metrics to a file: JSON for *.json, Prometheus text otherwise
+        (e.g. a *.prom file for the node_exporter textfile collector).
+        """
+        text = json.dumps(self.to_json(), indent=2) if path.endswith(".json") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+class JsonEventLogger:
+    """
+    Observer writing each event as one JSON line (structured logs).
+    Bulky debug fields (payload, response content) are left out.
+    """
+
+    SKIPPED_FIELDS = ("payload", "content", "headers")
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        record = {k: v for k, v in event.items() if k not in self.SKIPPED_FIELDS}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
@@ -1,198 +1,427 @@
 # utils/processing.py
 
+import hashlib
 import random
+import sys
+import time
 import requests
 import json
-import streamlit as st
+from utils.client import as_client, response_text
+from utils.events import notify, redact_headers, response_content, span
+from utils.io import as_example_store
+from utils.prompts import DEFAULT_TOKEN_BUDGET, MIN_PARAGRAPH_TOKENS, compress_previous, estimate_tokens, window_paragraph
+from utils.resilience import CircuitOpenError
+from utils.validation import LIST_MARKER_RE, normalize, rank_candidates, repair_transition
 
-def get_transition_from_gpt(para_a, para_b, examples, client, headers=None, model="gpt-4", previous_transitions=None):
+# Static instructions shared by the per-pair and batched prompts
+TRANSITION_RULES = (
+    "Tu es un assistant de presse francophone spécialisé dans la création de transitions. "
+    "Ta tâche est de produire UNE TRANSITION DE 5 MOTS EXACTEMENT entre deux paragraphes.\n\n"
+
+    "🔴 RÈGLE PRINCIPALE ET ABSOLUE 🔴\n"
+    "• LA TRANSITION DOIT CONTENIR EXACTEMENT 5 MOTS (NI PLUS, NI MOINS)\n\n"
+
+    "EXEMPLES DE TRANSITIONS CORRECTES À 5 MOTS :\n"
+    "• 'Passons maintenant au point suivant'\n"
+    "• 'Cette situation mérite notre attention'\n"
+    "• 'À présent, examinons autre chose'\n"
+    "• 'Ces développements changent la donne'\n"
+    "• 'Dans ce contexte, précisons que'\n\n"
+
+    "RÈGLES SECONDAIRES :\n"
+    "• Éviter les répétitions de mots\n"
+    "• Ne jamais réutiliser une transition précédente\n"
+    "• Éviter d'utiliser toujours 'Par ailleurs' ou 'En parallèle'\n\n"
+
+    "INSTRUCTIONS POUR LA DERNIÈRE TRANSITION :\n"
+    "Pour la dernière transition uniquement, utiliser une formule conclusive en 5 mots exactement.\n\n"
+)
+
+# Closing instruction of the per-pair prompt
+SINGLE_ANSWER_RULE = (
+    "🔢 COMPTE TES MOTS AVANT DE RÉPONDRE\n"
+    "TA RÉPONSE DOIT ÊTRE UNE PHRASE DE 5 MOTS, RIEN D'AUTRE."
+)
+
+# Closing line of the per-pair prompt
+SINGLE_ANSWER_FOOTER = "Ta réponse doit être UNE transition de EXACTEMENT 5 MOTS."
+
+# Closing instruction and line of the per-pair prompt asking for several candidates
+CANDIDATES_RULE = (
+    "🔢 COMPTE TES MOTS AVANT DE RÉPONDRE\n"
+    "PROPOSE PLUSIEURS TRANSITIONS DIFFÉRENTES, CHACUNE DE 5 MOTS EXACTEMENT."
+)
+CANDIDATES_FOOTER = (
+    "Réponds UNIQUEMENT avec un tableau JSON de {count} chaînes toutes différentes, "
+    "par exemple : [\"transition 1\", \"transition 2\"]. "
+    "Chaque chaîne doit contenir EXACTEMENT 5 MOTS."
+)
+
+# Safe 5-word transitions used when the API gives no usable answer
+FALLBACK_TRANSITION = "Passons maintenant au point suivant"
+FALLBACK_FINAL_TRANSITION = "Pour conclure cette analyse importante"
+FALLBACK_TRANSITIONS = (FALLBACK_TRANSITION, FALLBACK_FINAL_TRANSITION)
+
+# Static parts of the per-pair prompts, built (and measured) once
+SINGLE_PREFIX = TRANSITION_RULES + SINGLE_ANSWER_RULE
+SINGLE_FIXED_TOKENS = estimate_tokens(SINGLE_PREFIX) + estimate_tokens(SINGLE_ANSWER_FOOTER) + 20
+CANDIDATES_PREFIX = TRANSITION_RULES + CANDIDATES_RULE
+CANDIDATES_FIXED_TOKENS = estimate_tokens(CANDIDATES_PREFIX) + estimate_tokens(CANDIDATES_FOOTER) + 20
+
+def _pair_rng(para_a, para_b):
+    seed = hashlib.sha256(f"{para_a.strip()}\0{para_b.strip()}".encode("utf-8")).digest()
+    return random.Random(seed)
+
+def _similar_examples(store, para_a, para_b):
+    # Imported lazily: NumPy is only needed by the "similar" sampler
+    from utils.retrieval import similar_examples
+    return similar_examples(store, para_a, para_b, k=3, word_count=5)
+
+def _format_examples(selected_examples):
+    return "".join(f"Contexte : {ex['input']}\nTransition : {ex['transition']}\n\n" for ex in selected_examples)
+
+def _format_previous(previous_transitions):
+    listed, banned_words = compress_previous(previous_transitions)
+    text = "\n\nTRANSITIONS DÉJÀ UTILISÉES (À NE PAS RÉPÉTER) :\n"
+    for i, t in enumerate(listed, 1):
+        text += f"{i}. '{t}'\n"
+    if banned_words:
+        text += "NE COMMENCE PAS PAR : " + ", ".join(f"'{w}'" for w in banned_words) + "\n"
+    return text
+
+def build_transition_prompt(para_a, para_b, selected_examples, previous_transitions=(), token_budget=DEFAULT_TOKEN_BUDGET, candidates=1):
+    """
+    Build the per-pair prompt within 'token_budget' (estimated tokens).
+    With candidates > 1 the model is asked for a JSON array of that many
+    different transitions instead of a single one.
+
+    The static instructions are shared, previous transitions beyond the most
+    recent few are reduced to banned leading words, few-shot examples are
+    dropped if they crowd out the paragraphs, and the paragraphs keep only
+    their sentences nearest the marker (end of A, start of B).
+
+    Returns (prompt, info) where info holds the estimated "tokens", the
+    "chars" and the number of "trimmed_sentences".
+    """
+    previous = _format_previous(previous_transitions) if previous_transitions else ""
+    examples = list(selected_examples or [])
+
+    if candidates > 1:
+        prefix, footer = CANDIDATES_PREFIX, CANDIDATES_FOOTER.format(count=candidates)
+        fixed_tokens = CANDIDATES_FIXED_TOKENS
+    else:
+        prefix, footer, fixed_tokens = SINGLE_PREFIX, SINGLE_ANSWER_FOOTER, SINGLE_FIXED_TOKENS
+
+    available = token_budget - fixed_tokens - estimate_tokens(previous)
+    examples_text = _format_examples(examples)
+    while examples and available - estimate_tokens(examples_text) < 2 * MIN_PARAGRAPH_TOKENS:
+        examples.pop()
+        examples_text = _format_examples(examples)
+    available -= estimate_tokens(examples_text)
+
+    # Each paragraph gets half of what's left, plus what the other one doesn't use
+    half = max(MIN_PARAGRAPH_TOKENS, available // 2)
+    spare_a = max(0, half - estimate_tokens(para_a.strip()))
+    spare_b = max(0, half - estimate_tokens(para_b.strip()))
+    text_a, dropped_a = window_paragraph(para_a, half + spare_b, keep="end")
+    text_b, dropped_b = window_paragraph(para_b, half + spare_a, keep="start")
+
+    prompt = prefix + previous
+    if examples:
+        prompt += "\n\nEXEMPLES :\n" + examples_text
+    prompt += f"\nParagraphe A :\n{text_a}\n\nParagraphe B :\n{text_b}\n\n"
+    prompt += footer
+    return prompt, {
+        "tokens": estimate_tokens(prompt),
+        "chars": len(prompt),
+        "trimmed_sentences": dropped_a + dropped_b,
+    }
+
+def get_transition_from_gpt(para_a, para_b, examples, client, headers=None, model="gpt-4", previous_transitions=None, show_debug=None, sampler="random", on_partial=None, observer=None, token_budget=DEFAULT_TOKEN_BUDGET, candidates=1):
     """
     Generate a context-aware French transition (EXACTLY 5 words)
     using few-shot prompting from the examples list and API.
-    Note: 'client' parameter is now expected to be an API URL
+    Note: 'client' may be an ApiClient (pooled session) or a bare API URL
+    'show_debug' marks the events as debug details (payload, response body);
+    it defaults to the first transition only.
+    'sampler' picks few-shot examples at "random" or by "similar" context.
+    'on_partial', if given, streams the response and is called with the text so far.
+    'observer' receives request/response/error events (see utils.events).
+    'token_budget' caps the estimated size of the prompt (see build_transition_prompt).
+    'candidates' > 1 asks for that many transitions in one call and keeps
+    the best one (see get_transition_candidates).
+    """
+    return get_transition_candidates(
+        para_a, para_b, examples, client, headers=headers, model=model,
+        previous_transitions=previous_transitions, show_debug=show_debug, sampler=sampler,
+        on_partial=on_partial, observer=observer, token_budget=token_budget, candidates=candidates,
+    )[0]
+
+def get_transition_candidates(para_a, para_b, examples, client, headers=None, model="gpt-4", previous_transitions=None, show_debug=None, sampler="random", on_partial=None, observer=None, token_budget=DEFAULT_TOKEN_BUDGET, candidates=1):
+    """
+    Same as get_transition_from_gpt, but returns every valid transition of
+    the answer, best first (never empty: the fallback is used last).
+
+    With candidates > 1 the model proposes that many transitions in one
+    call; each is repaired and scored locally (word count, repeats of the
+    previous transitions, repeated words) so a second round trip is only
+    needed when none of them is usable. Streaming is off in that case, the
+    partial text would be a JSON array.
     """
     # Initialize empty list for previous transitions if none provided
     if previous_transitions is None:
         previous_transitions = []
+
+    if show_debug is None:
+        show_debug = not previous_transitions
     
-    # Use default headers if none provided
-    if headers is None:
-        headers = {"Content-Type": "application/json"}
-    
-    # Use only 5-word examples for few-shot learning
-    five_word_examples = []
-    for ex in examples:
-        if len(ex["transition"].split()) == 5:
-            five_word_examples.append(ex)
-    
-    selected_examples = []
-    if len(five_word_examples) >= 3:
-        # Prefer using 5-word examples
-        selected_examples = random.sample(five_word_examples, 3)
-    else:
-        # Fallback to original examples
-        selected_examples = random.sample(examples, min(3, len(examples)))
+    # Wrap bare URLs so every request goes through the pooled session
+    api = as_client(client, headers)
 
-    # Build the prompt for the API
-    prompt = (
-        "Tu es un assistant de presse francophone spécialisé dans la création de transitions. "
-        "Ta tâche est de produire UNE TRANSITION DE 5 MOTS EXACTEMENT entre deux paragraphes.\n\n"
-        
-        "🔴 RÈGLE PRINCIPALE ET ABSOLUE 🔴\n"
-        "• LA TRANSITION DOIT CONTENIR EXACTEMENT 5 MOTS (NI PLUS, NI MOINS)\n\n"
-        
-        "EXEMPLES DE TRANSITIONS CORRECTES À 5 MOTS :\n"
-        "• 'Passons maintenant au point suivant'\n"
-        "• 'Cette situation mérite notre attention'\n"
-        "• 'À présent, examinons autre chose'\n"
-        "• 'Ces développements changent la donne'\n"
-        "• 'Dans ce contexte, précisons que'\n\n"
-        
-        "RÈGLES SECONDAIRES :\n"
-        "• Éviter les répétitions de mots\n"
-        "• Ne jamais réutiliser une transition précédente\n"
-        "• Éviter d'utiliser toujours 'Par ailleurs' ou 'En parallèle'\n\n"
-        
-        "INSTRUCTIONS POUR LA DERNIÈRE TRANSITION :\n"
-        "Pour la dernière transition uniquement, utiliser une formule conclusive en 5 mots exactement.\n\n"
-        
-        "🔢 COMPTE TES MOTS AVANT DE RÉPONDRE\n"
-        "TA RÉPONSE DOIT ÊTRE UNE PHRASE DE 5 MOTS, RIEN D'AUTRE."
-    )
-
-    # Add information about previously used transitions
-    if previous_transitions:
-        prompt += f"\n\nTRANSITIONS DÉJÀ UTILISÉES (À NE PAS RÉPÉTER) :\n"
-        for i, t in enumerate(previous_transitions, 1):
-            prompt += f"{i}. '{t}'\n"
-
-    # Add few-shot examples
-    if selected_examples:
-        prompt += "\n\nEXEMPLES :\n"
-        for ex in selected_examples:
-            prompt += f"Contexte : {ex['input']}\nTransition : {ex['transition']}\n\n"
-
-    # Add the paragraphs
-    prompt += f"\nParagraphe A :\n{para_a.strip()}\n\nParagraphe B :\n{para_b.strip()}\n\n"
-    prompt += "Ta réponse doit être UNE transition de EXACTEMENT 5 MOTS."
+    # Prefer 5-word examples for few-shot learning (pre-bucketed in the store)
+    # Random sampling is seeded by the pair itself, so the same article builds
+    # the same prompt and can be answered from the response cache
+    with span(observer, "sampling", sampler=sampler):
+        store = as_example_store(examples)
+        if sampler == "similar":
+            selected_examples = _similar_examples(store, para_a, para_b)
+        else:
+            selected_examples = store.sample(3, word_count=5, rng=_pair_rng(para_a, para_b))
+
+    # Build the prompt for the API, within the token budget
+    with span(observer, "prompt"):
+        prompt, prompt_info = build_transition_prompt(
+            para_a, para_b, selected_examples, previous_transitions, token_budget, candidates,
+        )
+    if candidates > 1:
+        on_partial = None
     
-    # Prepare the payload
+    # Prepare the payload (backends with structured outputs answer a JSON list)
     payload = {"prompt": prompt}
-    
-    # Show debug info for the first transition only to avoid clutter
-    if not previous_transitions:
-        with st.expander("API Transition Debug (Expand to see details)", expanded=False):
-            st.write("**API URL:**", client)
-            st.write("**Headers:**", {k: "..." if k == "Authorization" else v for k, v in headers.items()})
-            st.write("**Payload Sample:**", {"prompt": prompt[:200] + "... [truncated]"})
+    if candidates > 1 and api.structured:
+        payload["schema"] = "transitions"
     
     # Generate transitions until we get a valid one
     max_attempts = 3
     for attempt in range(max_attempts):
         try:
-            # Call the API
-            response = requests.post(
-                client,
-                json=payload,
-                headers=headers,
-                timeout=35  # Increased timeout
+            # Debug details (payload sample) for the first transition only to avoid clutter
+            notify(
+                observer, "request", source="transition", attempt=attempt + 1,
+                debug=show_debug and attempt == 0, url=api.url,
+                headers=redact_headers(api.headers), payload_chars=len(prompt),
+                payload_tokens=estimate_tokens(prompt),
+                trimmed_sentences=prompt_info["trimmed_sentences"] if attempt == 0 else 0,
+                payload={"prompt": prompt[:200] + "... [truncated]"},
+            )
+
+            # Call the API over the shared keep-alive connection pool
+            # (cached responses are only served on the first attempt)
+            started = time.perf_counter()
+            response = api.post(payload, use_cache=(attempt == 0), on_text=on_partial, observer=observer)
+
+            notify(
+                observer, "response", source="transition", attempt=attempt + 1,
+                debug=show_debug and attempt == 0, status=response.status_code,
+                seconds=time.perf_counter() - started,
+                from_cache=getattr(response, "from_cache", False),
+                content=response_content(response) if show_debug and attempt == 0 else None,
             )
             
-            # Debug the response for the first transition and first attempt only
-            if not previous_transitions and attempt == 0:
-                with st.expander("API Response for Transition (Expand to see details)", expanded=False):
-                    st.write("**Status Code:**", response.status_code)
-                    try:
-                        st.write("**Response Content:**", response.json())
-                    except:
-                        st.write("**Raw Response:**", response.text)
-            
-            # Check status code before proceeding
+            # Check status code before proceeding (the client already retried
+            # with backoff, so go straight to the fallback)
             if response.status_code != 200:
-                print(f"API error on attempt {attempt+1}: Status code {response.status_code}")
-                if attempt == max_attempts - 1:
-                    # Use fallback if this is the last attempt
-                    break
-                continue
-            
-            # Try to handle different response formats
-            try:
-                result = response.json()
-                
-                # Extract transition from response based on its format
-                if "response" in result:
-                    transition = result["response"].strip()
-                elif "choices" in result and len(result["choices"]) > 0:
-                    # Handle OpenAI-like format
-                    transition = result["choices"][0]["message"]["content"].strip()
-                elif "generations" in result and len(result["generations"]) > 0:
-                    # Handle Anthropic-like format
-                    transition = result["generations"][0]["text"].strip()
-                elif "output" in result:
-                    # Handle generic output field
-                    transition = result["output"].strip()
-                elif isinstance(result, str):
-                    # Handle if the response itself is a string
-                    transition = result.strip()
-                else:
-                    # If we can't find a known field, try using the raw text
-                    transition = str(result)
-            except (ValueError, json.JSONDecodeError):
-                # If response isn't valid JSON, try using the raw text
-                transition = response.text.strip()
-            
-            # Clean up the transition
-            transition = transition.strip('.,;:"\'!?()-')
-            
-            # Check word count
-            words = transition.split()
-            word_count = len(words)
-            
-            # If exactly 5 words, return it
-            if word_count == 5:
-                return transition
-            
-            # If too long, just trim and return
-            if word_count > 5:
-                return " ".join(words[:5])
+                print(f"API error on attempt {attempt+1}: Status code {response.status_code}", file=sys.stderr)
+                break
             
-            # If too short and this is our last attempt, add generic words
-            if attempt == max_attempts - 1 and word_count < 5:
-                if word_count == 4:
-                    return transition + " notamment"
-                elif word_count == 3:
-                    return transition + " bien entendu"
-                else:
-                    # Fallback transitions - made sure each has exactly 5 words
-                    fallbacks = [
-                        "Passons maintenant au point suivant",
-                        "Examinons maintenant ce point important",
-                        "Considérons aussi cet aspect essentiel",
-                        "Cette situation mérite notre attention",
-                        "Notons également ce fait important"
-                    ]
-                    return fallbacks[attempt % len(fallbacks)]
+            transition = response_text(response)
+
+            # Several candidates: keep the usable ones, best first
+            if candidates > 1:
+                ranked = rank_candidates(parse_candidate_list(transition), previous_transitions)
+                if ranked:
+                    return ranked
+                continue
+
+            # Clean up and fix the length locally (trim or pad) when possible,
+            # only answers too short or cut mid-phrase are asked again
+            transition, action = repair_transition(transition)
+            if transition is not None:
+                if action is not None:
+                    notify(observer, "repair", source="transition", action=action)
+                return [transition]
         
+        except CircuitOpenError:
+            # Backend known to be down: fail fast to the fallback
+            notify(observer, "error", source="transition", attempt=attempt + 1, error="circuit_open")
+            break
         except requests.exceptions.ConnectionError:
-            print(f"Connection error on attempt {attempt+1}")
-            if attempt == max_attempts - 1:
-                break
+            print(f"Connection error on attempt {attempt+1}", file=sys.stderr)
+            notify(observer, "error", source="transition", attempt=attempt + 1, error="connection")
+            break
         except requests.exceptions.Timeout:
-            print(f"Timeout error on attempt {attempt+1}")
-            if attempt == max_attempts - 1:
-                break
+            print(f"Timeout error on attempt {attempt+1}", file=sys.stderr)
+            notify(observer, "error", source="transition", attempt=attempt + 1, error="timeout")
+            break
         except Exception as e:
             # Handle API errors, log and continue to fallback
-            print(f"API error on attempt {attempt+1}: {str(e)}")
+            print(f"API error on attempt {attempt+1}: {str(e)}", file=sys.stderr)
+            notify(observer, "error", source="transition", attempt=attempt + 1, error=str(e))
             if attempt == max_attempts - 1:
                 break
             # Adjust prompt if needed for next attempt
             prompt += "\n\nTrès important: Ta réponse doit être EXACTEMENT 5 mots."
     
     # If all attempts failed, return a safe fallback
+    notify(observer, "repair", source="transition", action="fallback")
     is_final = para_b.strip().endswith((".", "!", "?")) and not any(next_para.strip() for next_para in para_b.split("\n") if next_para.strip())
     
     if is_final:
-        return "Pour conclure cette analyse importante"  # Fixed to 5 words
+        return [FALLBACK_FINAL_TRANSITION]
     else:
-        return "Passons maintenant au point suivant"  # Fixed to 5 words
+        return [FALLBACK_TRANSITION]
+
+def parse_transition_list(text, expected_count):
+    """
+    Parse a JSON array of transitions out of a model answer.
+
+    Returns a list of length 'expected_count' where each slot holds a cleaned
+    5-word transition (trimmed or padded locally if needed), or None when the
+    slot is missing, malformed, can't be fixed, or repeats an earlier slot.
+    """
+    slots = [None] * expected_count
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return slots
+    try:
+        items = json.loads(text[start:end + 1])
+    except (ValueError, json.JSONDecodeError):
+        return slots
+    if not isinstance(items, list):
+        return slots
+
+    seen = set()
+    for i, item in enumerate(items[:expected_count]):
+        if not isinstance(item, str):
+            continue
+        transition, _ = repair_transition(item)
+        if transition is None:
+            continue
+        key = normalize(transition)
+        if key not in seen:
+            slots[i] = transition
+            seen.add(key)
+    return slots
+
+def parse_candidate_list(text):
+    """
+    Candidate transitions from a model answer: a JSON array of strings, or
+    else one candidate per line (numbering and bullets removed).
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+        except (ValueError, json.JSONDecodeError):
+            items = None
+        if isinstance(items, list):
+            return [item for item in items if isinstance(item, str)]
+    lines = (LIST_MARKER_RE.sub("", line) for line in text.splitlines())
+    return [line for line in lines if line.strip()]
+
+def get_transitions_batch(pairs, examples, client, headers=None, model="gpt-4", show_debug=False, sampler="random", observer=None, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Generate the transitions of a whole article in a single API call.
+
+    The shared instructions and few-shot examples are sent once for all
+    pairs, and the model is asked for a JSON array with one 5-word
+    transition per pair.
+
+    Each paragraph is windowed to a quarter of 'token_budget' (the budget
+    of a per-pair prompt), keeping the sentences nearest its marker.
+
+    Returns a list with one entry per pair: the transition, or None for slots
+    that failed validation (the caller falls back to per-pair calls for those).
+    """
+    api = as_client(client, headers)
+    slots = [None] * len(pairs)
+    if not pairs:
+        return slots
+
+    # Few-shot examples picked once for the whole article
+    with span(observer, "sampling", sampler=sampler):
+        store = as_example_store(examples)
+        context_a = "\n".join(a for a, _ in pairs)
+        context_b = "\n".join(b for _, b in pairs)
+        if sampler == "similar":
+            selected_examples = _similar_examples(store, context_a, context_b)
+        else:
+            selected_examples = store.sample(3, word_count=5, rng=_pair_rng(context_a, context_b))
+
+    with span(observer, "prompt"):
+        paragraph_tokens = max(MIN_PARAGRAPH_TOKENS, token_budget // 4)
+        trimmed_sentences = 0
+        prompt = TRANSITION_RULES
+        prompt += (
+            f"Tu vas recevoir {len(pairs)} paires de paragraphes numérotées. "
+            "Produis UNE transition de 5 mots exactement pour CHAQUE paire, "
+            "toutes différentes les unes des autres.\n\n"
+        )
+
+        if selected_examples:
+            prompt += "EXEMPLES :\n"
+            for ex in selected_examples:
+                prompt += f"Contexte : {ex['input']}\nTransition : {ex['transition']}\n\n"
+
+        for i, (para_a, para_b) in enumerate(pairs, 1):
+            text_a, dropped_a = window_paragraph(para_a, paragraph_tokens, keep="end")
+            text_b, dropped_b = window_paragraph(para_b, paragraph_tokens, keep="start")
+            trimmed_sentences += dropped_a + dropped_b
+            prompt += f"\nPAIRE {i}\nParagraphe A :\n{text_a}\n\nParagraphe B :\n{text_b}\n"
+
+        prompt += (
+            f"\nRéponds UNIQUEMENT avec un tableau JSON de {len(pairs)} chaînes, "
+            "dans l'ordre des paires, par exemple : [\"transition 1\", \"transition 2\"]. "
+            "Chaque chaîne doit contenir EXACTEMENT 5 MOTS."
+        )
+
+    payload = {"prompt": prompt}
+    if api.structured:
+        payload["schema"] = "transitions"
+
+    try:
+        notify(
+            observer, "request", source="batch", attempt=1, debug=show_debug,
+            url=api.url, headers=redact_headers(api.headers), payload_chars=len(prompt),
+            payload_tokens=estimate_tokens(prompt), trimmed_sentences=trimmed_sentences,
+            payload={"prompt": prompt[:200] + "... [truncated]", "pairs": len(pairs)},
+        )
+
+        started = time.perf_counter()
+        response = api.post(payload, observer=observer)
+
+        notify(
+            observer, "response", source="batch", attempt=1, debug=show_debug,
+            status=response.status_code, seconds=time.perf_counter() - started,
+            from_cache=getattr(response, "from_cache", False),
+            content=response_content(response) if show_debug else None,
+        )
+
+        if response.status_code != 200:
+            print(f"API error on batch request: Status code {response.status_code}", file=sys.stderr)
+            return slots
+
+        return parse_transition_list(response_text(response), len(pairs))
+
+    except CircuitOpenError:
+        notify(observer, "error", source="batch", attempt=1, error="circuit_open")
+    except requests.exceptions.ConnectionError:
+        print("Connection error on batch request", file=sys.stderr)
+        notify(observer, "error", source="batch", attempt=1, error="connection")
+    except requests.exceptions.Timeout:
+        print("Timeout error on batch request", file=sys.stderr)
+        notify(observer, "error", source="batch", attempt=1, error="timeout")
+    except Exception as e:
+        print(f"API error on batch request: {str(e)}", file=sys.stderr)
+        notify(observer, "error", source="batch", attempt=1, error=str(e))
+    return slots
@@ -0,0 +1,106 @@
+# utils/prompts.py
+#
+# Helpers keeping prompts within a token budget: token estimates, sentence
+# windowing of the paragraphs around a TRANSITION marker, and compression of
+# the "already used" transitions into banned leading words.
+
+import math
+import re
+from collections import Counter
+
+# Default budget (estimated tokens) of one per-pair prompt
+DEFAULT_TOKEN_BUDGET = 800
+
+# A paragraph is never windowed below this many tokens
+MIN_PARAGRAPH_TOKENS = 40
+
+# Previous transitions quoted in full, the older ones only ban their first word
+MAX_LISTED_TRANSITIONS = 5
+MAX_BANNED_WORDS = 20
+
+# Rough tokenizer ratio for French text (accents and apostrophes split more)
+CHARS_PER_TOKEN = 3.5
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_EDGE_PUNCTUATION = ".,;:\"'!?()-«»“”’…"
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate of a text (no tokenizer needed).
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sentences(text):
+    return [s for s in _SENTENCE_END.split(text.strip()) if s]
+
+
+def _cut_words(sentence, max_tokens, keep):
+    # Last resort for a single sentence over budget: keep the words nearest
+    # the marker and mark the cut with an ellipsis
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    words = sentence.split()
+    if keep == "end":
+        words = words[::-1]
+    kept, used = [], 0
+    for word in words:
+        if kept and used + len(word) + 1 > max_chars:
+            break
+        kept.append(word)
+        used += len(word) + 1
+    if keep == "end":
+        return "… " + " ".join(reversed(kept))
+    return " ".join(kept) + " …"
+
+
+def window_paragraph(text, max_tokens, keep="end"):
+    """
+    Keep only the sentences of a paragraph nearest the transition so it fits
+    in 'max_tokens': the last sentences with keep="end" (paragraph before the
+    marker), the first ones with keep="start" (paragraph after it).
+
+    Returns (text, number of sentences dropped).
+    """
+    text = text.strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text, 0
+
+    sentences = split_sentences(text)
+    ordered = sentences[::-1] if keep == "end" else sentences
+    kept, used = [], 0
+    for sentence in ordered:
+        tokens = estimate_tokens(sentence) + 1
+        if kept and used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if keep == "end":
+        kept.reverse()
+
+    dropped = len(sentences) - len(kept)
+    if len(kept) == 1 and used > max_tokens:
+        return _cut_words(kept[0], max_tokens, keep), dropped
+    return " ".join(kept), dropped
+
+
+def leading_word(transition):
+    """
+    First word of a transition, lowercase and without edge punctuation. Also
+    the key of the leading-word buckets of the example stores (utils.io,
+    utils.corpus), which must agree.
+    """
+    words = transition.split()
+    return words[0].strip(_EDGE_PUNCTUATION).lower() if words else ""
+
+
+def compress_previous(previous_transitions):
+    """
+    Split the already used transitions into the most recent ones, quoted in
+    full, and the leading words of the older ones (most frequent first).
+    """
+    listed = list(previous_transitions[-MAX_LISTED_TRANSITIONS:])
+    older = previous_transitions[:-MAX_LISTED_TRANSITIONS] if len(previous_transitions) > MAX_LISTED_TRANSITIONS else []
+    listed_words = {leading_word(t) for t in listed}
+    counts = Counter(w for w in map(leading_word, older) if w and w not in listed_words)
+    return listed, [w for w, _ in counts.most_common(MAX_BANNED_WORDS)]
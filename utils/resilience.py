@@ -0,0 +1,168 @@
+# utils/resilience.py
+
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+# Statuses worth retrying: rate limited, or the backend is struggling
+RATE_LIMITED = 429
+RETRY_STATUSES = (RATE_LIMITED, 500, 502, 503, 504)
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 8.0
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of calling an endpoint whose circuit breaker is open.
+    """
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """
+    Raised when the time budget of the article is spent.
+    """
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date),
+    or None if absent or unreadable.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random
+    time between 0 and min(max_delay, base_delay * 2**n), or what the
+    server asked for in Retry-After if that's longer. A Retry-After beyond
+    max_delay is not waited for: the call gives up instead, so one answer
+    can't block a worker for an hour.
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, retry_statuses=RETRY_STATUSES):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before the next attempt, or None to stop retrying.
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            return max(backoff, retry_after)
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    After 'failure_threshold' consecutive failures the circuit opens and
+    calls fail fast for 'reset_timeout' seconds. Then a single probe call is
+    let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_started = now
+                return True
+            # Half-open: let another probe through if the last one never reported back
+            if self.state == self.HALF_OPEN and now - self._probe_started >= self.reset_timeout:
+                self._probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def get_breaker(url, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+    """
+    Process-wide circuit breaker for an endpoint, shared by all sessions.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(url)
+        if breaker is None:
+            breaker = CircuitBreaker(failure_threshold, reset_timeout)
+            _breakers[url] = breaker
+        return breaker
+
+
+class Deadline:
+    """
+    Total time budget (e.g. for one article). None means no limit.
+    """
+
+    def __init__(self, seconds=None):
+        self.expires = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def clamp(self, timeout):
+        """
+        Shrink a (connect, read) or scalar timeout to fit the remaining budget.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
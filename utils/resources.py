@@ -0,0 +1,66 @@
+# utils/resources.py
+#
+# Process-wide resources shared by every Streamlit session of this server.
+
+import threading
+
+import streamlit as st
+
+from utils.cache import ResponseCache
+from utils.client import SingleFlight, build_session
+from utils.jobs import JobRunner
+from utils.metrics import Metrics
+
+
+@st.cache_resource
+def get_http_session(pool_connections, pool_maxsize):
+    """
+    One pooled keep-alive session per server process (and pool settings),
+    so TCP/TLS connections to the API are reused across reruns and sessions.
+    """
+    return build_session(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+
+@st.cache_resource
+def get_response_cache(path, max_entries, max_bytes, ttl):
+    """
+    One on-disk response cache per server process, so identical prompts
+    from any session are answered without calling the API again.
+    """
+    return ResponseCache(path, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+
+@st.cache_resource
+def get_single_flight():
+    """
+    One request coalescer per server process: editors of different sessions
+    working on the same story share a single call per identical prompt.
+    """
+    return SingleFlight()
+
+
+@st.cache_resource
+def get_request_semaphore(limit):
+    """
+    Process-wide cap on the requests outstanding to the backend at once,
+    whatever the number of sessions.
+    """
+    return threading.BoundedSemaphore(limit)
+
+
+@st.cache_resource
+def get_metrics():
+    """
+    Process-wide metrics, accumulated over every run of every session.
+    """
+    return Metrics()
+
+
+@st.cache_resource
+def get_job_runner(max_workers):
+    """
+    One background job runner per server process: generations keep running
+    (and their results stay available) whatever happens to the script run
+    that started them.
+    """
+    return JobRunner(max_workers)
@@ -0,0 +1,184 @@
+# utils/retrieval.py
+
+import os
+import re
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+# Size of the hashed feature space (one float32 column per bucket)
+DEFAULT_DIMS = 256
+
+# Bump when the feature extraction changes, so persisted indexes are rebuilt
+INDEX_VERSION = 2
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_index_lock = threading.Lock()
+
+
+def _features(text):
+    """
+    Hashed features for a text: every word of 4+ letters plus its 5-letter
+    prefix, which cheaply folds most French plural/gender/verb endings.
+    """
+    features = []
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) < 4 or word.isdigit():
+            continue
+        features.append(word)
+        if len(word) > 5:
+            features.append(word[:5] + "*")
+    return features
+
+
+def _counts(text, dims):
+    vec = np.zeros(dims, dtype=np.float32)
+    for feature in _features(text):
+        vec[zlib.crc32(feature.encode("utf-8")) % dims] += 1.0
+    return vec
+
+
+class SimilarityIndex:
+    """
+    TF-IDF matrix (one L2-normalised row per example) over hashed word
+    features of the examples' 'input' field, queried with one mat-vec.
+
+    Rows are sorted by transition word count, so a word-count bucket is a
+    contiguous slice of the matrix and only that slice is multiplied.
+    """
+
+    def __init__(self, matrix, idf, word_counts, example_ids):
+        self.matrix = matrix
+        self.idf = idf
+        self.word_counts = word_counts
+        self.example_ids = example_ids
+
+    @classmethod
+    def build(cls, examples, dims=DEFAULT_DIMS):
+        counts = np.zeros((len(examples), dims), dtype=np.float32)
+        for i, ex in enumerate(examples):
+            counts[i] = _counts(ex["input"], dims)
+        df = np.count_nonzero(counts, axis=0)
+        idf = (np.log((1.0 + len(examples)) / (1.0 + df)) + 1.0).astype(np.float32)
+        matrix = np.log1p(counts) * idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+        word_counts = np.array([len(ex["transition"].split()) for ex in examples], dtype=np.int16)
+        order = np.argsort(word_counts, kind="stable")
+        return cls(matrix[order], idf, word_counts[order], order.astype(np.int64))
+
+    @property
+    def dims(self):
+        return self.matrix.shape[1]
+
+    def save(self, path, source_stat=None):
+        mtime, size = source_stat if source_stat else (0, 0)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                matrix=self.matrix,
+                idf=self.idf,
+                word_counts=self.word_counts,
+                example_ids=self.example_ids,
+                meta=np.array([INDEX_VERSION, mtime, size], dtype=np.int64),
+            )
+
+    @classmethod
+    def load(cls, path, source_stat=None):
+        """
+        Load a persisted index, or return None if it's stale or unreadable.
+        """
+        try:
+            with np.load(path) as data:
+                version, mtime, size = (int(v) for v in data["meta"])
+                if version != INDEX_VERSION:
+                    return None
+                if source_stat and (mtime, size) != tuple(source_stat):
+                    return None
+                return cls(data["matrix"], data["idf"], data["word_counts"], data["example_ids"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _bucket(self, word_count):
+        lo = int(np.searchsorted(self.word_counts, word_count, side="left"))
+        hi = int(np.searchsorted(self.word_counts, word_count, side="right"))
+        return lo, hi
+
+    def query(self, text, k, word_count=None):
+        """
+        Return the positions (in the examples list) of the k examples most
+        similar to text by cosine similarity, restricted to one transition
+        word count when that bucket holds at least k examples.
+        """
+        q = np.log1p(_counts(text, self.dims)) * self.idf
+        norm = float(np.linalg.norm(q))
+        if norm == 0.0 or k <= 0:
+            return []
+
+        lo, hi = 0, len(self.word_counts)
+        if word_count is not None:
+            b_lo, b_hi = self._bucket(word_count)
+            if b_hi - b_lo >= k:
+                lo, hi = b_lo, b_hi
+        if hi == lo:
+            return []
+        scores = self.matrix[lo:hi] @ (q / norm)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return self.example_ids[lo + top].tolist()
+
+
+def index_path_for(source_path):
+    root, _ = os.path.splitext(source_path)
+    return root + ".index.npz"
+
+
+def get_index(store, dims=DEFAULT_DIMS):
+    """
+    Return the similarity index of an ExampleStore, built once per store.
+    When the store was loaded from a file, the index is persisted next to
+    it and reused by later processes until the file changes.
+    """
+    index = getattr(store, "similarity_index", None)
+    if index is not None and index.dims == dims:
+        return index
+
+    with _index_lock:
+        index = getattr(store, "similarity_index", None)
+        if index is not None and index.dims == dims:
+            return index
+
+        source_path = getattr(store, "source_path", None)
+        source_stat = None
+        if source_path:
+            stat = os.stat(source_path)
+            source_stat = (stat.st_mtime_ns, stat.st_size)
+            index = SimilarityIndex.load(index_path_for(source_path), source_stat)
+            if index is not None and index.dims != dims:
+                index = None
+
+        if index is None:
+            index = SimilarityIndex.build(store.examples, dims=dims)
+            if source_path:
+                try:
+                    index.save(index_path_for(source_path), source_stat)
+                except OSError as e:
+                    print(f"Could not persist similarity index: {str(e)}", file=sys.stderr)
+
+        store.similarity_index = index
+        return index
+
+
+def similar_examples(store, para_a, para_b, k=3, word_count=None):
+    """
+    Pick the k examples whose context is closest to the paragraph pair.
+    Falls back to random sampling when the pair has no usable features.
+    """
+    rows = get_index(store).query(f"{para_a}\n{para_b}", k, word_count=word_count)
+    if not rows:
+        return store.sample(k, word_count=word_count)
+    return [store.examples[i] for i in rows]
@@ -0,0 +1,328 @@
+# utils/router.py
+#
+# Several generation endpoints behind one client: load balancing by
+# observed latency (and weight), failover to the next endpoint on errors,
+# and optional hedged requests for the slow tail.
+
+import copy
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from utils.client import ApiClient
+from utils.events import notify
+from utils.resilience import CircuitBreaker, DeadlineExceeded
+
+# Latencies kept per endpoint for its moving average and percentiles
+LATENCY_WINDOW = 200
+
+# Weight of the newest latency in the moving average
+LATENCY_ALPHA = 0.2
+
+# Hedging starts once an endpoint has this many latencies recorded
+MIN_HEDGE_SAMPLES = 20
+
+DEFAULT_HEDGE_QUANTILE = 95
+MIN_HEDGE_DELAY = 0.05
+
+# Threads sending hedged requests, for the whole server process
+DEFAULT_HEDGE_WORKERS = 32
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def parse_endpoints(value, default_url=None, default_token=None):
+    """
+    Endpoint list from configuration: a list of URLs or of tables with
+    "url" and optional "token" and "weight", or a comma-separated string
+    of URLs. Falls back to the single default endpoint when empty.
+
+    Returns a list of {"url", "token", "weight"} dicts.
+    """
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split(",") if v.strip()]
+    endpoints = []
+    for item in value or ():
+        if isinstance(item, str):
+            item = {"url": item}
+        item = dict(item)
+        if not item.get("url"):
+            continue
+        endpoints.append({
+            "url": item["url"],
+            "token": item.get("token", default_token),
+            "weight": max(0.0, float(item.get("weight", 1.0))),
+        })
+    if not endpoints and default_url:
+        endpoints.append({"url": default_url, "token": default_token, "weight": 1.0})
+    return endpoints
+
+
+class EndpointStats:
+    """
+    Observed latency and load of one endpoint, shared by every router
+    (and session) sending to it.
+    """
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.average = None
+        self.in_flight = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, seconds=None, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.failures += 1
+            if seconds is not None:
+                self.latencies.append(seconds)
+                if self.average is None:
+                    self.average = seconds
+                else:
+                    self.average += LATENCY_ALPHA * (seconds - self.average)
+
+    def score(self, weight):
+        """
+        Expected wait on this endpoint, lower is better: average latency
+        scaled by the requests already queued on it, divided by its weight.
+        Endpoints not measured yet score 0 so they get tried.
+        """
+        with self._lock:
+            if self.average is None:
+                return 0.0
+            return self.average * (1 + self.in_flight) / max(weight, 1e-6)
+
+    def quantile(self, q):
+        """
+        Nearest-rank latency quantile (q in 0-100), None until enough samples.
+        """
+        with self._lock:
+            if len(self.latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def get_endpoint_stats(url):
+    """
+    Process-wide latency statistics of an endpoint, so what one run learnt
+    about it is used by the next ones.
+    """
+    with _stats_lock:
+        stats = _stats.get(url)
+        if stats is None:
+            stats = _stats[url] = EndpointStats()
+        return stats
+
+
+class Endpoint:
+    __slots__ = ("client", "weight", "stats")
+
+    def __init__(self, client, weight=1.0, stats=None):
+        self.client = client
+        self.weight = weight
+        self.stats = stats if stats is not None else get_endpoint_stats(client.url)
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def get_hedge_pool():
+    """
+    Process-wide threads sending routed requests when hedging is on.
+    """
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=DEFAULT_HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_pool
+
+
+class Router(ApiClient):
+    """
+    ApiClient spreading requests over several endpoints (each an ApiClient
+    with its own URL, credentials, retry policy and circuit breaker).
+
+    The response cache and request coalescing are the router's (pass them
+    here, not to the endpoint clients), so a prompt answered by any
+    endpoint is not asked again.
+
+    Parameters:
+    - clients (list of ApiClient): One client per endpoint.
+    - weights (list of float, optional): Relative capacity of each endpoint.
+    - hedge (bool): When the chosen endpoint hasn't answered after its
+      'hedge_quantile' latency, send the same request to the next best
+      endpoint and keep whichever answers first. Streaming calls are
+      never hedged.
+    - hedge_quantile (float): Latency percentile (0-100) used as hedge delay.
+    - Other parameters as for ApiClient.
+    """
+
+    def __init__(self, clients, weights=None, hedge=False, hedge_quantile=DEFAULT_HEDGE_QUANTILE,
+                 cache=None, read_cache=True, model=None, deadline=None, single_flight=None, pool=None):
+        if not clients:
+            raise ValueError("Router needs at least one endpoint")
+        weights = weights or [1.0] * len(clients)
+        super().__init__(
+            " | ".join(c.url for c in clients),
+            headers=clients[0].headers,
+            session=clients[0].session,
+            cache=cache,
+            read_cache=read_cache,
+            # Part of the cache and coalescing keys: defaults to the endpoints' model
+            model=model if model is not None else clients[0].model,
+            # Endpoints have their own breakers; this one is never used
+            breaker=CircuitBreaker(),
+            deadline=deadline,
+            single_flight=single_flight,
+        )
+        self.endpoints = [Endpoint(c, w) for c, w in zip(clients, weights)]
+        self.structured = all(c.structured for c in clients)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.pool = pool
+
+    def ranked(self):
+        """
+        Endpoints in the order to try them: the better of two picked at
+        random by weight (so load spreads instead of herding on the
+        fastest), then the others by score. Endpoints whose circuit is open
+        come last.
+        """
+        candidates = [e for e in self.endpoints if e.weight > 0] or list(self.endpoints)
+        first = random.choices(candidates, weights=[e.weight or 1.0 for e in candidates], k=2)
+        first = min(first, key=lambda e: e.stats.score(e.weight))
+        rest = sorted((e for e in self.endpoints if e is not first), key=lambda e: e.stats.score(e.weight))
+        order = [first] + rest
+        return [e for e in order if e.client.breaker.state != CircuitBreaker.OPEN] + \
+               [e for e in order if e.client.breaker.state == CircuitBreaker.OPEN]
+
+    def _send(self, payload, key, timeout, on_text, observer):
+        # Try the endpoints in turn (two at a time when hedging) until one
+        # gives a usable answer; see post() for the cache and coalescing
+        order = self.ranked()
+        hedge = self.hedge and on_text is None and len(order) > 1
+        response = None
+        error = None
+        while order:
+            if self.deadline is not None and self.deadline.expired():
+                break
+            primary = order.pop(0)
+            if hedge and order:
+                result, error, used, tried = self._hedged(primary, order, payload, timeout, observer)
+                order = [e for e in order if e not in tried]
+            else:
+                result, error = self._call(primary, payload, timeout, on_text, observer)
+                used = primary
+            if result is not None:
+                response = result
+                if _usable(response):
+                    if self.cache is not None and response.status_code == 200:
+                        self.cache.set(key, response.text)
+                    return response
+            if order:
+                notify(
+                    observer, "failover", url=used.client.url, to=order[0].client.url,
+                    status=response.status_code if result is not None else None,
+                    error=type(error).__name__ if error is not None and result is None else None,
+                )
+        if response is not None:
+            return response
+        if error is not None:
+            raise error
+        raise DeadlineExceeded(f"Time budget spent before calling {self.url}")
+
+    def _call(self, endpoint, payload, timeout, on_text, observer):
+        # One request through an endpoint's client (its own retries included).
+        # Returns (response, None) or (None, exception).
+        client = copy.copy(endpoint.client)
+        client.deadline = self.deadline
+        endpoint.stats.started()
+        started = time.perf_counter()
+        try:
+            response = client._send(payload, None, timeout, on_text, observer)
+        except requests.exceptions.RequestException as e:
+            endpoint.stats.finished(failed=not isinstance(e, DeadlineExceeded))
+            return None, e
+        endpoint.stats.finished(time.perf_counter() - started, failed=not _usable(response))
+        return response, None
+
+    def _hedged(self, primary, others, payload, timeout, observer):
+        # Send to 'primary'; past its p95 latency, also send to the best of
+        # 'others'. The first usable answer wins, the other is discarded as
+        # soon as it arrives (requests can't abort a call mid-flight).
+        pool = self.pool or get_hedge_pool()
+        futures = {pool.submit(self._call, primary, payload, timeout, None, observer): primary}
+        delay = primary.stats.quantile(self.hedge_quantile)
+        if delay is not None:
+            delay = max(MIN_HEDGE_DELAY, delay)
+            if self.deadline is not None:
+                delay = min(delay, self.deadline.remaining())
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                backup = others[0]
+                notify(observer, "hedge", url=primary.client.url, to=backup.client.url, delay=delay)
+                futures[pool.submit(self._call, backup, payload, timeout, None, observer)] = backup
+
+        tried = list(futures.values())
+        pending = set(futures)
+        result, error, used = None, None, primary
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                response, exc = future.result()
+                if result is None or (not _usable(result) and response is not None):
+                    result, error, used = response, exc, futures[future]
+                elif response is not None:
+                    response.close()
+            if result is not None and _usable(result):
+                break
+        for future in pending:
+            future.cancel()
+            future.add_done_callback(_discard)
+        if result is not None and _usable(result) and used is not primary:
+            notify(observer, "hedge_won", url=used.client.url)
+        return result, error, used, tried
+
+    def stats(self):
+        """
+        Per-endpoint latency and load, for debugging.
+        """
+        rows = []
+        for e in self.endpoints:
+            rows.append({
+                "url": e.client.url,
+                "weight": e.weight,
+                "average_ms": None if e.stats.average is None else e.stats.average * 1000,
+                "p95_ms": None if e.stats.quantile(95) is None else e.stats.quantile(95) * 1000,
+                "in_flight": e.stats.in_flight,
+                "failures": e.stats.failures,
+                "circuit": e.client.breaker.state,
+            })
+        return rows
+
+
+def _usable(response):
+    # Worth returning as is: anything but a server error or rate limiting
+    return response.status_code < 500 and response.status_code != 429
+
+
+def _discard(future):
+    # Close the answer of a hedged call that lost the race
+    if future.cancelled():
+        return
+    response, _ = future.result()
+    if response is not None:
+        response.close()
@@ -1,8 +1,11 @@
 # utils/title_blurb.py
 
+import time
 import requests
-import json
-import streamlit as st
+from utils.client import as_client, response_text
+from utils.events import notify, redact_headers, response_content
+from utils.prompts import estimate_tokens
+from utils.resilience import CircuitOpenError
 
 PROMPT = """Tu es un assistant de rédaction pour un journal local français.
 
@@ -28,86 +31,96 @@ Titre : [titre généré]
 Chapeau : [chapeau généré]
 """
 
-def generate_title_and_blurb(paragraph, client, headers=None):
+class TitleBlurbError(Exception):
+    """
+    No title and blurb could be generated. The message says why, in the
+    "Titre : ...\nChapeau : ..." form of a normal answer.
+    """
+
+
+def generate_title_and_blurb(paragraph, client, headers=None, on_partial=None, observer=None):
     """
     Generate a title and blurb for the given paragraph using the API.
     
     Args:
         paragraph (str): The paragraph to generate a title and blurb for.
-        client (str): The API URL to use.
+        client (ApiClient or str): The API client, or a bare API URL.
         headers (dict, optional): Headers for the API request, including auth.
+        on_partial (callable, optional): Stream the response, calling this
+            with the text received so far.
+        observer (callable, optional): Receives request/response/error
+            events (see utils.events).
     
     Returns:
         str: The generated title and blurb.
+
+    Raises:
+        TitleBlurbError: The API failed or gave an empty answer.
     """
-    # Use default headers if none provided
-    if headers is None:
-        headers = {"Content-Type": "application/json"}
-    
+    # Wrap bare URLs so every request goes through the pooled session
+    api = as_client(client, headers)
+
     try:
         # Create the full prompt for the API
         full_prompt = f"{PROMPT}\n\nParagraphe:\n{paragraph.strip()}"
         
-        # Prepare the payload
+        # Prepare the payload (backends with structured outputs answer both fields as JSON)
         payload = {"prompt": full_prompt}
+        if api.structured:
+            payload["schema"] = "title_blurb"
         
-        # Add debugging in Streamlit
-        with st.expander("API Debug Info (Expand to see details)", expanded=False):
-            st.write("**API URL:**", client)
-            st.write("**Headers:**", {k: "..." if k == "Authorization" else v for k, v in headers.items()})
-            st.write("**Payload:**", payload)
-        
-        # Call the API
-        response = requests.post(
-            client,
-            json=payload,
-            headers=headers,
-            timeout=35  # Increased timeout
+        # Report the request for debugging
+        notify(
+            observer, "request", source="title", attempt=1, debug=True,
+            url=api.url, headers=redact_headers(api.headers),
+            payload_chars=len(full_prompt), payload_tokens=estimate_tokens(full_prompt), payload=payload,
         )
         
-        # Debug the response
-        with st.expander("API Response (Expand to see details)", expanded=False):
-            st.write("**Status Code:**", response.status_code)
-            try:
-                st.write("**Response Content:**", response.json())
-            except:
-                st.write("**Raw Response:**", response.text)
+        # Call the API over the shared keep-alive connection pool
+        started = time.perf_counter()
+        response = api.post(payload, on_text=on_partial, observer=observer)
+        
+        # Report the response for debugging
+        notify(
+            observer, "response", source="title", attempt=1, debug=True,
+            status=response.status_code, seconds=time.perf_counter() - started,
+            from_cache=getattr(response, "from_cache", False),
+            content=response_content(response),
+        )
         
         # Check status code before proceeding
         if response.status_code != 200:
-            return f"Titre : Erreur API (code {response.status_code})\nChapeau : L'API a retourné une erreur. Vérifiez l'URL et que le service est en cours d'exécution."
-        
-        # Try to parse the response as JSON
-        try:
-            result = response.json()
-        except json.JSONDecodeError:
-            # If response isn't JSON, try to use the raw text if it looks like our format
-            if "Titre :" in response.text and "Chapeau :" in response.text:
-                return response.text
-            return f"Titre : Format de réponse incorrect\nChapeau : La réponse de l'API n'est pas un JSON valide."
+            raise _failure(observer, f"status_{response.status_code}", f"Titre : Erreur API (code {response.status_code})\nChapeau : L'API a retourné une erreur. Vérifiez l'URL et que le service est en cours d'exécution.")
         
-        # Handle different response formats
-        if "response" in result:
-            return result["response"].strip()
-        elif "choices" in result and len(result["choices"]) > 0:
-            # Handle OpenAI-like format
-            return result["choices"][0]["message"]["content"].strip()
-        elif "generations" in result and len(result["generations"]) > 0:
-            # Handle Anthropic-like format
-            return result["generations"][0]["text"].strip()
-        elif "output" in result:
-            # Handle generic output field
-            return result["output"].strip()
-        elif isinstance(result, str):
-            # Handle if the response itself is a string
-            return result.strip()
-        else:
-            # If we can't find a known field, dump the entire response as debug
-            return f"Titre : Format de réponse incorrect\nChapeau : La réponse de l'API a un format inconnu. Contenu : {str(result)[:100]}..."
+        text = response_text(response)
+        if not text:
+            raise _failure(observer, "empty", "Titre : Format de réponse incorrect\nChapeau : La réponse de l'API est vide.")
+        return text
             
+    except TitleBlurbError:
+        raise
+    except CircuitOpenError:
+        raise _failure(observer, "circuit_open", "Titre : Service indisponible\nChapeau : L'API est actuellement hors service, nouvelle tentative automatique dans quelques instants.")
     except requests.exceptions.ConnectionError:
-        return f"Titre : Erreur de connexion\nChapeau : Impossible de se connecter à l'API. Vérifiez l'URL et que le service est en cours d'exécution."
+        raise _failure(observer, "connection", "Titre : Erreur de connexion\nChapeau : Impossible de se connecter à l'API. Vérifiez l'URL et que le service est en cours d'exécution.")
     except requests.exceptions.Timeout:
-        return f"Titre : Délai d'attente dépassé\nChapeau : L'API n'a pas répondu dans le délai imparti. Le service peut être surchargé."
+        raise _failure(observer, "timeout", "Titre : Délai d'attente dépassé\nChapeau : L'API n'a pas répondu dans le délai imparti. Le service peut être surchargé.")
     except Exception as e:
-        return f"Titre : Erreur technique\nChapeau : {str(e)}"
+        raise _failure(observer, str(e), f"Titre : Erreur technique\nChapeau : {str(e)}") from e
+
+
+def _failure(observer, error, message):
+    # Report the failure (with the message to show) and build the exception
+    notify(observer, "error", source="title", attempt=1, error=error, message=message)
+    return TitleBlurbError(message)
+
+
+def failure_message(events):
+    """
+    Why the title and blurb couldn't be generated, from the events of the
+    run (see utils.events.EventLog), or None.
+    """
+    for event in reversed(events):
+        if event["kind"] == "error" and event.get("source") == "title" and event.get("message"):
+            return event["message"]
+    return None
@@ -0,0 +1,305 @@
+# utils/validation.py
+#
+# Local, deterministic validation and repair of generated transitions:
+# French-aware word counting, duplicate and repeated-word detection, and
+# repairs from a ranked pool of known-good transitions, so fixable answers
+# never cost another API call. Everything here is a single pass over the
+# transitions.
+
+import re
+from collections import Counter, namedtuple
+
+# Required length of a transition, in words
+TRANSITION_WORDS = 5
+
+# A word: letters/digits, with inner hyphens ("peut-être") and apostrophes
+# ("aujourd'hui"). Elisions ("l'actualité") stay one word, as for the model.
+_WORD_RE = re.compile(r"[\w]+(?:[-'’][\w]+)*['’]?", re.UNICODE)
+_ELISION_RE = re.compile(r"^(?:[cdjlmnst]|qu|jusqu|lorsqu|puisqu|quoiqu)['’]", re.IGNORECASE)
+_LABEL_RE = re.compile(r"^\s*transition\s*\d*\s*:\s*", re.IGNORECASE)
+# List numbering or bullet in front of an answer ("1.", "2)", "-", "•")
+LIST_MARKER_RE = re.compile(r"^\s*(?:\d+[.)]|[-•*])\s*")
+_EDGE_PUNCTUATION = ".,;:\"'!?()-«»“”’…[] "
+
+# Short function words that may repeat, and that can't end a transition
+STOPWORDS = frozenset(
+    "à au aux ce ces cet cette d de des du en et il la le les l mais ne ni nous "
+    "on ou par pas pour qu que qui se sur un une vous y".split()
+)
+
+# Words appended to complete a transition that is one or two words short
+PAD_ONE = " notamment"
+PAD_ONE_FINAL = " maintenant"
+PAD_TWO = " bien entendu"
+
+# Last-resort candidates, always available after the dataset ones
+BACKUP_CANDIDATES = (
+    "Passons maintenant au point suivant",
+    "Examinons maintenant ce point important",
+    "Considérons aussi cet aspect essentiel",
+    "Cette situation mérite notre attention",
+    "Notons également ce fait important",
+    "Soulignons encore ce point important",
+    "Précisons ce point très important",
+    "Ajoutons cette information très essentielle",
+    "Il faut aussi mentionner ceci",
+    "À noter également ce fait",
+)
+BACKUP_FINAL_CANDIDATES = (
+    "Pour conclure cette analyse importante",
+    "Pour finir, retenons ce point",
+    "Terminons enfin par cette information",
+)
+
+# Leading words of transitions that close an article
+_FINAL_LEADS = ("enfin", "pour conclure", "pour finir", "pour terminer", "nous terminons", "terminons", "en conclusion")
+
+# One change made by repair_transitions: index, action, text before and after
+Repair = namedtuple("Repair", "index action before after")
+
+
+def tokenize(text):
+    """
+    Words of a French text. Standalone punctuation (" : ", " ! ", "—")
+    is not a word; elided and hyphenated forms are one word each.
+    """
+    return _WORD_RE.findall(text)
+
+
+def word_count(text):
+    return len(tokenize(text))
+
+
+def word_key(word):
+    """
+    Comparison key of a word: lowercase, elided article/pronoun removed.
+    """
+    return _ELISION_RE.sub("", word.replace("’", "'")).lower()
+
+
+def normalize(text):
+    """
+    Comparison key of a whole transition (case, punctuation and
+    apostrophe style ignored).
+    """
+    return " ".join(word.replace("’", "'").lower() for word in tokenize(text))
+
+
+def _clean_line(line):
+    line = _LABEL_RE.sub("", LIST_MARKER_RE.sub("", line))
+    return " ".join(line.split()).strip(_EDGE_PUNCTUATION)
+
+
+def clean(text):
+    """
+    Strip list numbering ("1."), labels ("Transition :"), quotes and edge
+    punctuation from an answer, keeping one line only: the first with
+    exactly 5 words, or else the first that isn't a preamble ending in ":"
+    ("Voici ma transition :").
+    """
+    lines = [line.strip() for line in text.strip().split("\n")]
+    kept = [_clean_line(line) for line in lines if line and not line.endswith(":")]
+    for line in kept:
+        if word_count(line) == TRANSITION_WORDS:
+            return line
+    if kept:
+        return kept[0]
+    return _clean_line(lines[0])
+
+
+def repeated_words(text):
+    """
+    Content words used more than once in the transition.
+    """
+    counts = Counter(k for k in map(word_key, tokenize(text)) if k and k not in STOPWORDS)
+    return [w for w, n in counts.items() if n > 1]
+
+
+def is_final_transition(text):
+    lowered = text.lower()
+    return lowered.startswith(_FINAL_LEADS)
+
+
+def fix_length(text, final=False):
+    """
+    Bring a cleaned transition to exactly 5 words if that can be done
+    locally. Returns (text, action) with action None (already valid),
+    "truncate" or "pad", or (None, "unfixable") when it needs replacing.
+    """
+    words = tokenize(text)
+    count = len(words)
+    if count == TRANSITION_WORDS:
+        return text, None
+    if count > TRANSITION_WORDS:
+        # Cut right after the 5th word, in the original text, so punctuation
+        # and apostrophes inside the kept part are preserved
+        end = 0
+        for i, match in enumerate(_WORD_RE.finditer(text)):
+            if i == TRANSITION_WORDS - 1:
+                end = match.end()
+                break
+        trimmed = text[:end].strip(_EDGE_PUNCTUATION)
+        if word_key(tokenize(trimmed)[-1]) in STOPWORDS:
+            return None, "unfixable"
+        return trimmed, "truncate"
+    if count == TRANSITION_WORDS - 1:
+        return text + (PAD_ONE_FINAL if final else PAD_ONE), "pad"
+    if count == TRANSITION_WORDS - 2:
+        return text + PAD_TWO, "pad"
+    return None, "unfixable"
+
+
+class CandidatePool:
+    """
+    Known-good 5-word transitions: the built-in generic backups first, then
+    the dataset's own (edited, published) transitions, most used first.
+    Dataset transitions often name their article's topic ("côté football"),
+    so they only come once the generic ones are used. Closing transitions
+    are kept apart for the last slot of an article.
+    """
+
+    def __init__(self, transitions=()):
+        counts = Counter()
+        first_seen = {}
+        for t in transitions:
+            t = clean(t)
+            if "[" in t or word_count(t) != TRANSITION_WORDS or repeated_words(t):
+                continue
+            key = normalize(t)
+            counts[key] += 1
+            first_seen.setdefault(key, t)
+        ranked = [first_seen[k] for k, _ in counts.most_common()]
+        # Dataset transitions only, most used first (what a compiled corpus keeps)
+        self.ranked = ranked
+        regular = list(BACKUP_CANDIDATES) + [t for t in ranked if not is_final_transition(t)]
+        final = list(BACKUP_FINAL_CANDIDATES) + [t for t in ranked if is_final_transition(t)]
+        # (key, text) pairs in preference order, keys computed once
+        self.regular = [(normalize(t), t) for t in regular + final]
+        self.final = [(normalize(t), t) for t in final + regular]
+
+    def pick(self, used, final=False):
+        """
+        Best candidate whose key is not in 'used' (a set of normalize()
+        keys), closing transitions first when 'final'. Once every candidate
+        is used, they are reused in turn.
+        """
+        candidates = self.final if final else self.regular
+        for key, t in candidates:
+            if key not in used:
+                return t
+        return candidates[len(used) % len(candidates)][1]
+
+
+def get_candidate_pool(store):
+    """
+    Candidate pool of an ExampleStore, built on first use and kept on it.
+    A compiled corpus (utils.corpus) carries its ranked transitions, so the
+    whole dataset isn't scanned.
+    """
+    pool = getattr(store, "candidate_pool", None)
+    if pool is None:
+        ranked = getattr(store, "pool_transitions", None)
+        pool = CandidatePool(ranked if ranked is not None else (ex["transition"] for ex in store))
+        store.candidate_pool = pool
+    return pool
+
+
+def find_duplicate_slots(transitions, fixed=()):
+    """
+    Return the indices of transitions that repeat an earlier transition.
+
+    The first occurrence is kept, every later occurrence is reported.
+    Slots listed in 'fixed' are never reported: they count as coming first.
+    Comparison ignores case, punctuation and surrounding whitespace.
+    """
+    fixed = set(fixed)
+    seen = {normalize(transitions[i]) for i in fixed}
+    duplicates = []
+    for i, t in enumerate(transitions):
+        if i in fixed:
+            continue
+        key = normalize(t)
+        if key in seen:
+            duplicates.append(i)
+        else:
+            seen.add(key)
+    return duplicates
+
+
+def repair_transition(text, final=False):
+    """
+    Clean and length-fix one answer. Returns (text, action) like
+    fix_length, with the cleaned text when nothing else was needed.
+    """
+    return fix_length(clean(text), final=final)
+
+
+def rank_candidates(texts, previous_transitions=()):
+    """
+    Repair and rank candidate answers for one slot, best first: not a
+    repeat of 'previous_transitions', fewest repeated words, untouched by
+    the repair, then the model's own order. Unfixable and repeated
+    candidates are dropped.
+    """
+    used = {normalize(t) for t in previous_transitions}
+    seen = set()
+    scored = []
+    for order, text in enumerate(texts):
+        fixed, action = repair_transition(text)
+        if fixed is None:
+            continue
+        key = normalize(fixed)
+        if key in seen:
+            continue
+        seen.add(key)
+        scored.append(((key in used, len(repeated_words(fixed)), action is not None, order), fixed))
+    scored.sort(key=lambda item: item[0])
+    return [fixed for _, fixed in scored]
+
+
+def choose_unique(candidate_lists, taken=()):
+    """
+    Pick one transition per slot from ranked candidate lists, in slot order,
+    taking each slot's best candidate not already picked by an earlier slot
+    or listed in 'taken' (its best one if they are all taken, left for the
+    caller to reconcile).
+    """
+    chosen = []
+    used = {normalize(t) for t in taken}
+    for ranked in candidate_lists:
+        pick = next((t for t in ranked if normalize(t) not in used), ranked[0])
+        used.add(normalize(pick))
+        chosen.append(pick)
+    return chosen
+
+
+def repair_transitions(transitions, pool):
+    """
+    Make every transition of an article valid in one pass: exactly 5 words
+    and no repeats. Answers are trimmed or padded when possible, and
+    unfixable or repeated ones are replaced from the candidate pool.
+    Transitions with a repeated content word are reported, not replaced.
+
+    Returns (transitions, list of Repair).
+    """
+    fixed = []
+    repairs = []
+    used = set()
+    last = len(transitions) - 1
+    for i, original in enumerate(transitions):
+        final = i == last
+        text, action = repair_transition(original or "", final=final)
+        if action not in (None, "unfixable"):
+            repairs.append(Repair(i, action, original, text))
+        if text is None:
+            text = pool.pick(used, final=final)
+            repairs.append(Repair(i, "replace", original, text))
+        elif normalize(text) in used:
+            replacement = pool.pick(used, final=final)
+            repairs.append(Repair(i, "duplicate", text, replacement))
+            text = replacement
+        elif repeated_words(text):
+            repairs.append(Repair(i, "repeated_word", text, text))
+        used.add(normalize(text))
+        fixed.append(text)
+    return fixed, repairs
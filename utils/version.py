@@ -1,10 +1,67 @@
 import hashlib
 import os
+import threading
+
+# Files whose content defines the app version shown in the UI
+VERSION_FILES = [
+    "app.py",
+    "transitions.json",
+    "utils/io.py",
+    "utils/processing.py",
+    "utils/layout.py",
+    "utils/display.py",
+    "utils/version.py",
+    "utils/title_blurb.py",
+    "utils/engine.py",
+    "utils/client.py",
+    "utils/resources.py",
+    "utils/retrieval.py",
+    "utils/cache.py",
+    "utils/events.py",
+    "utils/resilience.py",
+    "utils/metrics.py",
+    "utils/prompts.py",
+    "utils/validation.py",
+    "utils/router.py",
+    "utils/backends.py",
+    "utils/corpus.py",
+    "utils/jobs.py"
+]
+
+# Read size when hashing a file, so large files are never loaded whole
+HASH_CHUNK_SIZE = 1 << 20
+
+# Digests already computed, keyed by absolute path: {path: (mtime_ns, size, md5 hex)}
+_hash_cache = {}
+_hash_cache_lock = threading.Lock()
+
+
+def remember_file_hash(filepath, stat, digest):
+    """
+    Record the MD5 digest of a file read for another reason (e.g. the
+    example loader), so computing the version doesn't read it again.
+    """
+    with _hash_cache_lock:
+        _hash_cache[os.path.abspath(filepath)] = (stat.st_mtime_ns, stat.st_size, digest)
+
 
 def get_file_hash(filepath):
-    with open(filepath, "rb") as f:
-        file_bytes = f.read()
-    return hashlib.md5(file_bytes).hexdigest()
+    """
+    MD5 of a file, hashed in chunks. Cached until the file's mtime or size
+    changes, so only a stat() is needed on the next calls.
+    """
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    with _hash_cache_lock:
+        cached = _hash_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    remember_file_hash(path, stat, digest.hexdigest())
+    return digest.hexdigest()
 
 def compute_version_hash(files_to_check):
     combined = ""